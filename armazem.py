@@ -0,0 +1,147 @@
+"""
+Armazenamento colunar (Parquet) dos extratos do SIVEP já lidos.
+
+Cada DBF é convertido uma única vez e gravado em partições por regional,
+ano e semana epidemiológica da notificação:
+
+    <diretorio>/regiao=014_CRS/ano=2023/semana=12/<hash do DBF>.parquet
+
+O catálogo registra, para cada DBF e regional, o nome do arquivo de origem,
+o CRC-32 e o tamanho do DBF e as partições gravadas, em um pequeno arquivo
+JSON por entrada:
+
+    <diretorio>/catalogo/<hash do DBF>_014_CRS.json
+
+Cada entrada é gravada de forma atômica e o catálogo é relido do diretório a
+cada consulta, de modo que vários processos (o painel e a linha de comando,
+ou vários servidores) podem gravar no mesmo armazém sem perder entradas.
+Sessões seguintes leem apenas as partições da regional e as colunas
+necessárias, com memory-map, sem decodificar o DBF; as partições por ano e
+semana organizam os arquivos, mas a leitura de uma regional usa todas.
+"""
+import json
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from datas import converter_datas, semana_epidemiologica
+
+
+COLUNA_LINHA = '_linha'
+
+
+def _particoes(dados):
+    if 'DT_NOTIFIC' not in dados.columns:
+        zeros = pd.Series(0, index=dados.index)
+        return zeros, zeros
+    datas = converter_datas(dados['DT_NOTIFIC'])
+    ano, semana = semana_epidemiologica(datas)
+    return ano.fillna(0).astype(int), semana.fillna(0).astype(int)
+
+
+class ArmazemColunar:
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+        os.makedirs(self._diretorio_catalogo, exist_ok=True)
+
+    @property
+    def _diretorio_catalogo(self):
+        return os.path.join(self.diretorio, 'catalogo')
+
+    def _caminho_entrada(self, hash_dbf, regiao):
+        return os.path.join(self._diretorio_catalogo, hash_dbf + '_' + regiao.replace(' ', '_') + '.json')
+
+    def _ler_entrada(self, hash_dbf, regiao):
+        try:
+            with open(self._caminho_entrada(hash_dbf, regiao), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _gravar_entrada(self, hash_dbf, entrada):
+        caminho = self._caminho_entrada(hash_dbf, entrada['regiao'])
+        temporario = caminho + '.%d.%d.tmp' % (os.getpid(), threading.get_ident())
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump({'hash': hash_dbf, **entrada}, f, ensure_ascii=False, indent=1)
+        os.replace(temporario, caminho)
+
+    def contem(self, hash_dbf, regiao, colunas=None):
+        """Indica se o DBF já foi gravado para a regional, com todas as `colunas` pedidas."""
+        entrada = self._ler_entrada(hash_dbf, regiao)
+        if entrada is None:
+            return False
+        return colunas is None or set(colunas) <= set(entrada.get('colunas', []))
+
+    def extratos(self, regiao=None):
+        """Lista os extratos armazenados como dicionários (hash, nome, regiao, linhas)."""
+        entradas = []
+        for nome in os.listdir(self._diretorio_catalogo):
+            if not nome.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self._diretorio_catalogo, nome), encoding='utf-8') as f:
+                    entrada = json.load(f)
+            except FileNotFoundError:
+                continue
+            if regiao is None or entrada['regiao'] == regiao:
+                entradas.append(entrada)
+        return sorted(entradas, key=lambda entrada: (entrada['nome'], entrada['hash']))
+
+    def assinaturas(self):
+        """(CRC-32, tamanho) dos DBFs gravados.
+
+        Um DBF com outra assinatura certamente não está no armazém, e não
+        precisa do hash do conteúdo para essa consulta.
+        """
+        return {(entrada['crc32'], entrada['tamanho']) for entrada in self.extratos()}
+
+    def gravar(self, hash_dbf, nome, regiao, dados, colunas, crc32, tamanho):
+        """Grava o DataFrame de um DBF particionado por ano e semana da notificação.
+
+        `colunas` são as colunas pedidas na leitura do DBF; as que não existem
+        no arquivo também ficam registradas, para não forçar uma nova leitura.
+        `crc32` e `tamanho` (em bytes) do DBF, como no ZIP, entram em `assinaturas`.
+        """
+        dados = dados.reset_index(drop=True)
+        dados[COLUNA_LINHA] = pd.RangeIndex(len(dados), dtype='int32')
+        if len(dados):
+            grupos = dados.groupby(list(_particoes(dados)), sort=True)
+        else:
+            # Extrato sem notificações da regional: grava só o esquema
+            grupos = [((0, 0), dados)]
+
+        particoes = []
+        for (ano_particao, semana_particao), grupo in grupos:
+            relativo = os.path.join('regiao=' + regiao.replace(' ', '_'), 'ano=%d' % ano_particao,
+                                    'semana=%02d' % semana_particao, hash_dbf + '.parquet')
+            caminho = os.path.join(self.diretorio, relativo)
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            temporario = caminho + '.%d.%d.tmp' % (os.getpid(), threading.get_ident())
+            pq.write_table(pa.Table.from_pandas(grupo, preserve_index=False), temporario)
+            os.replace(temporario, caminho)
+            particoes.append({'ano': int(ano_particao), 'semana': int(semana_particao), 'arquivo': relativo})
+
+        # A entrada só é gravada depois das partições: quem a encontra pode lê-las
+        self._gravar_entrada(hash_dbf, {
+            'nome': nome, 'regiao': regiao, 'linhas': len(dados), 'particoes': particoes,
+            'colunas': list(colunas if colunas is not None else dados.columns.drop(COLUNA_LINHA)),
+            'crc32': crc32, 'tamanho': tamanho})
+
+    def ler(self, hash_dbf, regiao, colunas=None):
+        """Lê um extrato do armazém para a regional, restrito às colunas pedidas.
+
+        As linhas voltam na ordem do DBF de origem.
+        """
+        particoes = self._ler_entrada(hash_dbf, regiao)['particoes']
+        caminhos = [os.path.join(self.diretorio, particao['arquivo']) for particao in particoes]
+        esquema = pq.read_schema(caminhos[0])
+        if colunas is not None:
+            colunas = [coluna for coluna in colunas if coluna in esquema.names] + [COLUNA_LINHA]
+
+        tabelas = [pq.read_table(caminho, columns=colunas, memory_map=True) for caminho in caminhos]
+        dados = pa.concat_tables(tabelas).to_pandas()
+        dados = dados.sort_values(COLUNA_LINHA, kind='stable').drop(columns=COLUNA_LINHA)
+        return dados.reset_index(drop=True)
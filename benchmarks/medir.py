@@ -0,0 +1,158 @@
+"""
+Medição de tempo e memória de cada etapa do processamento do painel.
+
+Para cada tamanho, gera (ou reaproveita) um ZIP sintético e executa as
+etapas do pipeline em um processo novo, medindo o tempo de parede e o pico
+de memória residente (RSS) de cada etapa. O resultado é gravado em JSON e
+pode ser comparado com uma medição anterior, para acusar regressões antes
+de uma publicação:
+
+    python -m benchmarks.medir --tamanhos 10000 100000 1000000 --saida atual.json
+    python -m benchmarks.medir --tamanhos 10000 100000 1000000 --comparar base.json
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from benchmarks.sintetico import MUNICIPIOS_PAINEL, REGIAO_PAINEL, REGIOES, gerar_arquivo
+from exportacao import exportar
+from filtros import COLUNAS_FILTRO, IndiceCategorias
+from incremental import CargaIncremental
+from instrumentacao import Medicoes
+from pipeline import consolidar, ler_arquivos, ler_arquivos_regioes
+from processamento import agregar, cubo_semanal, decodificar, montar_tabelas
+
+
+TAMANHOS = [10000, 100000, 1000000]
+TOLERANCIA = 0.25
+# Diferenças de tempo menores que isto são ruído de medição
+TEMPO_MINIMO = 0.01
+
+
+def medir(medicoes, nome, funcao, *argumentos):
+    """Executa `funcao` como uma etapa de `medicoes` e devolve o resultado."""
+    with medicoes.etapa(nome) as registro:
+        resultado = funcao(*argumentos)
+        registro['linhas_saida'] = len(resultado) if hasattr(resultado, 'shape') else None
+    return resultado
+
+
+def _alterar(dados_geral, semente=0):
+    """Simula a carga da semana seguinte: 1% das notificações alteradas e 0,5% removidas."""
+    gerador = np.random.default_rng(semente)
+    dados = dados_geral[gerador.random(len(dados_geral)) >= 0.005].copy()
+    alteradas = gerador.random(len(dados)) < 0.01
+    dados.loc[alteradas, 'EVOLUCAO'] = '2'
+    return dados
+
+
+def _filtrar_todos(indice):
+    """Resolve, para cada coluna de filtro, a seleção de cada valor."""
+    return sum(len(indice.filtrar({coluna: valor}))
+               for coluna in COLUNAS_FILTRO for valor in indice.valores(coluna))
+
+
+def executar_etapas(caminho, processos=1):
+    """Executa as etapas do pipeline sobre o arquivo e devolve as medições."""
+    medicoes = Medicoes({'origem': 'benchmark', 'arquivo': os.path.basename(caminho)})
+    executor = (ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context('spawn'))
+                if processos > 1 else None)
+    try:
+        arquivos_dbf = medir(medicoes, 'leitura', ler_arquivos, [caminho], REGIAO_PAINEL, None, executor)
+        # Uma leitura para todas as regionais, como no processamento estadual
+        medir(medicoes, 'leitura_todas_regioes', ler_arquivos_regioes, [caminho], REGIOES, None, executor)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    pacientes_uti, dados_geral = medir(medicoes, 'consolidacao', consolidar, arquivos_dbf, REGIAO_PAINEL)
+    dados_consolidados2 = medir(medicoes, 'decodificacao', decodificar, dados_geral, REGIAO_PAINEL)
+    matriz = medir(medicoes, 'agregacao', agregar, dados_consolidados2, MUNICIPIOS_PAINEL)
+    cubo = medir(medicoes, 'cubo_semanal', cubo_semanal, dados_consolidados2)
+    medir(medicoes, 'tabelas', montar_tabelas, matriz, MUNICIPIOS_PAINEL)
+    indice = medir(medicoes, 'indice_filtros', IndiceCategorias, dados_consolidados2)
+    medir(medicoes, 'filtros', _filtrar_todos, indice)
+    medir(medicoes, 'exportacao_csv', exportar, dados_consolidados2, io.BytesIO(), 'CSV')
+    carga = medir(medicoes, 'assinaturas', CargaIncremental, dados_geral, dados_consolidados2, matriz, cubo, None, None,
+                  REGIAO_PAINEL, MUNICIPIOS_PAINEL)
+    medir(medicoes, 'atualizacao_incremental', carga.atualizar, _alterar(dados_geral))
+    return {'linhas_regiao': len(dados_geral), 'pacientes_uti': len(pacientes_uti), 'etapas': medicoes.etapas}
+
+
+def medir_tamanho(diretorio, linhas, processos=1, semente=0):
+    """Gera o arquivo do tamanho pedido, se ainda não existir, e mede as etapas em um processo novo."""
+    caminho = os.path.join(diretorio, f'sivep_{linhas}_{semente}.zip')
+    if not os.path.exists(caminho):
+        gerar_arquivo(caminho + '.tmp.zip', linhas, semente=semente)
+        os.replace(caminho + '.tmp.zip', caminho)
+
+    # Um processo por tamanho: o pico de memória de um não contamina o do outro
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        resultado = executor.submit(executar_etapas, caminho, processos).result()
+    return {'linhas': linhas, 'arquivo': os.path.basename(caminho), **resultado}
+
+
+def comparar(atual, base, tolerancia=TOLERANCIA):
+    """Lista as etapas em que o tempo ou o pico de RSS cresceram mais que `tolerancia`."""
+    anteriores = {(medicao['linhas'], etapa['etapa']): etapa for medicao in base['medicoes'] for etapa in medicao['etapas']}
+    regressoes = []
+    for medicao in atual['medicoes']:
+        for etapa in medicao['etapas']:
+            anterior = anteriores.get((medicao['linhas'], etapa['etapa']))
+            if anterior is None:
+                continue
+            for metrica, minimo in [('tempo', TEMPO_MINIMO), ('pico_rss', 0)]:
+                if etapa[metrica] > max(anterior[metrica] * (1 + tolerancia), anterior[metrica] + minimo):
+                    regressoes.append(f"{medicao['linhas']} linhas, {etapa['etapa']}: {metrica} "
+                                      f"{anterior[metrica]} -> {etapa[metrica]}")
+    return regressoes
+
+
+def _formatar(medicao):
+    linhas = [f"{medicao['linhas']} registros ({medicao['linhas_regiao']} da regional {REGIAO_PAINEL})"]
+    for etapa in medicao['etapas']:
+        linhas.append(f"  {etapa['etapa']:<25} {etapa['tempo']:>9.3f} s  pico {etapa['pico_rss'] / 1024 ** 2:>8.1f} MB"
+                      f"  (+{etapa['acrescimo_rss'] / 1024 ** 2:.1f} MB)")
+    return '\n'.join(linhas)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mede tempo e memória das etapas do painel com dados sintéticos.')
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=TAMANHOS, help='número de registros de cada arquivo')
+    parser.add_argument('--diretorio', default=os.path.join('.cache', 'benchmarks'),
+                        help='onde guardar os arquivos sintéticos gerados')
+    parser.add_argument('--processos', type=int, default=1, help='processos para a leitura dos DBFs')
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--saida', help='arquivo JSON onde gravar as medições')
+    parser.add_argument('--comparar', help='medição anterior (JSON) para comparar')
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA,
+                        help='aumento relativo aceito antes de acusar regressão')
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.diretorio, exist_ok=True)
+    atual = {'python': sys.version.split()[0], 'processos': args.processos, 'medicoes': []}
+    for linhas in args.tamanhos:
+        medicao = medir_tamanho(args.diretorio, linhas, args.processos, args.semente)
+        atual['medicoes'].append(medicao)
+        print(_formatar(medicao), flush=True)
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(atual, f, ensure_ascii=False, indent=1)
+
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            regressoes = comparar(atual, json.load(f), args.tolerancia)
+        for regressao in regressoes:
+            print('Regressão:', regressao)
+        if regressoes:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
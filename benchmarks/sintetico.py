@@ -0,0 +1,225 @@
+"""
+Gerador de arquivos DBF sintéticos no formato do SIVEP-Gripe.
+
+Os arquivos reais têm nomes de pacientes e não podem ser compartilhados.
+Os sintéticos têm o mesmo layout (campos de texto de largura fixa, várias
+regionais misturadas, colunas que o painel não usa) e distribuições de
+códigos próximas às do SIVEP, com resultados de PCR coerentes com a
+classificação final. Os registros são gerados e gravados em blocos, sem
+montar o arquivo inteiro na memória:
+
+    python -m benchmarks.sintetico srag_2023.zip --linhas 1000000
+"""
+import argparse
+import os
+import struct
+import zipfile
+from datetime import date
+
+import numpy as np
+
+from regioes import codigo_regiao, ler_regionais
+
+
+REGIAO_PAINEL = '014 CRS'
+REGIOES = [codigo_regiao(numero) for numero in range(1, 20)]
+MUNICIPIOS_PAINEL = ler_regionais()[REGIAO_PAINEL].municipios
+MUNICIPIOS_POR_REGIAO = 25
+
+# Campos usados pelo painel: (nome, largura)
+CAMPOS_SIVEP = [
+    ('NU_NOTIFIC', 12), ('DT_NOTIFIC', 10), ('DT_SIN_PRI', 10), ('ID_MUNICIP', 40), ('NM_PACIENT', 70),
+    ('ID_RG_RESI', 20), ('ID_MN_RESI', 40), ('UTI', 1), ('DT_SAIDUTI', 10), ('CRITERIO', 1), ('CLASSI_FIN', 1),
+    ('EVOLUCAO', 1), ('DT_EVOLUCA', 10), ('PCR_RESUL', 1), ('TP_FLU_PCR', 1), ('PCR_FLUASU', 1),
+    ('PCR_FLUBLI', 1), ('PCR_VSR', 1), ('PCR_PARA1', 1), ('PCR_PARA2', 1), ('PCR_PARA3', 1), ('PCR_PARA4', 1),
+    ('PCR_ADENO', 1), ('PCR_RINO', 1),
+]
+
+# Campos que o painel não usa, presentes para o registro ter o tamanho dos reais
+CAMPOS_EXTRAS = [
+    ('SEM_NOT', 2), ('SG_UF_NOT', 2), ('ID_REGIONA', 40), ('CO_REGIONA', 6), ('CO_MUN_NOT', 6),
+    ('ID_UNIDADE', 70), ('CO_UNI_NOT', 7), ('CS_SEXO', 1), ('DT_NASC', 10), ('NU_IDADE_N', 3), ('TP_IDADE', 1),
+    ('CS_GESTANT', 1), ('CS_RACA', 1), ('CS_ESCOL_N', 1), ('ID_PAIS', 20), ('SG_UF', 2), ('CO_RG_RESI', 6),
+    ('CO_MUN_RES', 6), ('CS_ZONA', 1), ('NOSOCOMIAL', 1), ('FEBRE', 1), ('TOSSE', 1), ('GARGANTA', 1),
+    ('DISPNEIA', 1), ('DESC_RESP', 1), ('SATURACAO', 1), ('DIARREIA', 1), ('VOMITO', 1), ('OUTRO_SIN', 1),
+    ('OUTRO_DES', 40), ('FATOR_RISC', 1), ('CARDIOPATI', 1), ('DIABETES', 1), ('OBESIDADE', 1), ('VACINA', 1),
+    ('DT_UT_DOSE', 10), ('ANTIVIRAL', 1), ('HOSPITAL', 1), ('DT_INTERNA', 10), ('SG_UF_INTE', 2),
+    ('ID_MN_INTE', 40), ('DT_ENTUTI', 10), ('SUPORT_VEN', 1), ('RAIOX_RES', 1), ('AMOSTRA', 1), ('DT_COLETA', 10),
+    ('TP_AMOSTRA', 1), ('DT_PCR', 10), ('POS_PCRFLU', 1), ('POS_PCROUT', 1), ('DT_ENCERRA', 10),
+    ('DT_DIGITA', 10), ('VACINA_COV', 1), ('DOSE_1_COV', 10), ('DOSE_2_COV', 10), ('LAB_PR_COV', 40),
+]
+
+# Distribuições dos códigos: {código: proporção}
+CLASSI_FIN = {'1': 0.05, '2': 0.07, '3': 0.01, '4': 0.45, '5': 0.30, '': 0.12}
+EVOLUCAO = {'1': 0.70, '2': 0.16, '3': 0.02, '9': 0.04, '': 0.08}
+UTI = {'1': 0.28, '2': 0.62, '9': 0.05, '': 0.05}
+CRITERIO = {'1': 0.80, '2': 0.03, '3': 0.10, '4': 0.02, '': 0.05}
+PCR_RESUL = {'1': 0.35, '2': 0.40, '3': 0.01, '4': 0.12, '5': 0.04, '9': 0.03, '': 0.05}
+
+# Agente detectado nos PCR com resultado detectável, fora os casos de Covid-19
+AGENTES = {'influenza': 0.35, 'VSR': 0.30, 'RINO': 0.20, 'ADENO': 0.07, 'PARA': 0.08}
+TP_FLU_PCR = {'1': 0.70, '2': 0.30}
+PCR_FLUASU = {'1': 0.40, '2': 0.45, '3': 0.15}
+PCR_FLUBLI = {'1': 0.90, '5': 0.10}
+
+FRACAO_REGIAO = 0.05
+FRACAO_EXCLUIDOS = 0.002
+REGISTROS_POR_BLOCO = 200000
+
+NOMES = ['ANA', 'JOÃO', 'MARIA', 'JOSÉ', 'ANTÔNIO', 'FRANCISCA', 'CARLOS', 'PAULO', 'LÚCIA', 'MÁRCIA', 'LUIZ',
+         'PEDRO', 'SEBASTIÃO', 'CONCEIÇÃO', 'HELENA', 'INÊS']
+SOBRENOMES = ['SILVA', 'SANTOS', 'OLIVEIRA', 'SOUZA', 'RODRIGUES', 'FERREIRA', 'ALVES', 'PEREIRA', 'LIMA',
+              'GONÇALVES', 'SCHNEIDER', 'MÜLLER', 'BECKER', 'WEBER', 'KLEIN', 'ROSA']
+
+
+def _campos():
+    return CAMPOS_SIVEP + CAMPOS_EXTRAS
+
+
+def _sortear(gerador, distribuicao, quantidade):
+    codigos = np.array(list(distribuicao), dtype='S')
+    pesos = np.array(list(distribuicao.values()))
+    return gerador.choice(codigos, size=quantidade, p=pesos / pesos.sum())
+
+
+def _datas(ano):
+    """Datas do ano no formato do SIVEP, com o peso de cada dia (pico no inverno)."""
+    dias = np.arange(np.datetime64(f'{ano}-01-01'), np.datetime64(f'{ano + 1}-01-01'))
+    texto = np.array([date.fromisoformat(str(dia)).strftime('%d/%m/%Y') for dia in dias], dtype='S10')
+    pesos = 1 + 0.8 * np.cos(2 * np.pi * (np.arange(len(dias)) - 180) / len(dias))
+    return texto, pesos / pesos.sum()
+
+
+def _deslocar(texto, indices, dias):
+    """Data `dias` depois (ou antes) da data de índice `indices`, limitada ao ano."""
+    return texto[np.clip(indices + dias, 0, len(texto) - 1)]
+
+
+def gerar_bloco(gerador, quantidade, inicio, ano=2023, fracao_regiao=FRACAO_REGIAO):
+    """Gera `quantidade` registros a partir do número `inicio`; devolve {campo: array de bytes}."""
+    vazio = np.full(quantidade, b'', dtype='S1')
+    registros = {}
+
+    registros['NU_NOTIFIC'] = (np.arange(inicio, inicio + quantidade) + ano * 10 ** 7).astype('S12')
+    registros['NM_PACIENT'] = np.char.add(
+        np.char.add(gerador.choice(np.char.encode(NOMES, 'latin-1'), quantidade), b' '),
+        gerador.choice(np.char.encode(SOBRENOMES, 'latin-1'), quantidade))
+
+    # Regional e municípios de residência e de notificação
+    da_regiao = gerador.random(quantidade) < fracao_regiao
+    outras = [regiao for regiao in REGIOES if regiao != REGIAO_PAINEL]
+    regiao = np.where(da_regiao, REGIAO_PAINEL.encode(), gerador.choice(np.array(outras, dtype='S'), quantidade))
+    municipio = np.where(
+        da_regiao, gerador.choice(np.array(MUNICIPIOS_PAINEL, dtype='S'), quantidade),
+        np.char.add(b'MUNICIPIO ', gerador.integers(1, len(outras) * MUNICIPIOS_POR_REGIAO, quantidade).astype('S4')))
+    registros['ID_RG_RESI'] = regiao
+    registros['ID_MN_RESI'] = municipio
+    # A maioria é notificada no município de residência
+    notificado_fora = gerador.random(quantidade) < 0.15
+    registros['ID_MUNICIP'] = np.where(notificado_fora, np.roll(municipio, 1), municipio)
+
+    # Datas
+    texto, pesos = _datas(ano)
+    dia = gerador.choice(len(texto), size=quantidade, p=pesos)
+    registros['DT_NOTIFIC'] = texto[dia]
+    registros['DT_SIN_PRI'] = np.where(gerador.random(quantidade) < 0.01, b'',
+                                       _deslocar(texto, dia, -gerador.geometric(0.25, quantidade) + 1))
+
+    # Classificação, evolução e UTI
+    classificacao = _sortear(gerador, CLASSI_FIN, quantidade)
+    evolucao = _sortear(gerador, EVOLUCAO, quantidade)
+    uti = _sortear(gerador, UTI, quantidade)
+    registros['CRITERIO'] = np.where(classificacao == b'', b'', _sortear(gerador, CRITERIO, quantidade))
+    registros['EVOLUCAO'] = evolucao
+    registros['DT_EVOLUCA'] = np.where(np.isin(evolucao, [b'1', b'2', b'3']),
+                                       _deslocar(texto, dia, gerador.integers(1, 30, quantidade)), b'')
+    registros['UTI'] = uti
+    registros['DT_SAIDUTI'] = np.where((uti == b'1') & (gerador.random(quantidade) < 0.7),
+                                       _deslocar(texto, dia, gerador.integers(3, 21, quantidade)), b'')
+
+    # PCR: o agente detectado define a classificação final
+    pcr = _sortear(gerador, PCR_RESUL, quantidade)
+    agente = np.where((pcr == b'1') & (classificacao != b'5'),
+                      _sortear(gerador, AGENTES, quantidade), b'')
+    influenza = agente == b'influenza'
+    tipo = np.where(influenza, _sortear(gerador, TP_FLU_PCR, quantidade), b'')
+    registros['PCR_RESUL'] = pcr
+    registros['TP_FLU_PCR'] = tipo
+    registros['PCR_FLUASU'] = np.where(tipo == b'1', _sortear(gerador, PCR_FLUASU, quantidade), b'')
+    registros['PCR_FLUBLI'] = np.where(tipo == b'2', _sortear(gerador, PCR_FLUBLI, quantidade), b'')
+    for campo, nome in [('PCR_VSR', b'VSR'), ('PCR_RINO', b'RINO'), ('PCR_ADENO', b'ADENO')]:
+        registros[campo] = np.where(agente == nome, b'1', vazio)
+    parainfluenza = gerador.integers(1, 5, quantidade)
+    for numero in range(1, 5):
+        registros[f'PCR_PARA{numero}'] = np.where((agente == b'PARA') & (parainfluenza == numero), b'1', vazio)
+    classificacao = np.where(influenza, b'1', np.where(agente != b'', b'2', classificacao))
+    registros['CLASSI_FIN'] = classificacao
+
+    # Campos não usados pelo painel: um dígito qualquer nos campos curtos
+    digitos = np.array(list('0123456789'), dtype='S1')
+    for campo, largura in CAMPOS_EXTRAS:
+        registros[campo] = digitos[gerador.integers(0, 10, quantidade)] if largura <= 3 else vazio
+    return registros
+
+
+def _cabecalho(campos, quantidade):
+    tamanho_registro = 1 + sum(largura for _, largura in campos)
+    tamanho_cabecalho = 32 + 32 * len(campos) + 1
+    hoje = date.today()
+    partes = [struct.pack('<BBBBLHH20x', 3, hoje.year - 1900, hoje.month, hoje.day, quantidade,
+                          tamanho_cabecalho, tamanho_registro)]
+    for nome, largura in campos:
+        partes.append(struct.pack('<11scLBB14x', nome.encode('ascii'), b'C', 0, largura, 0))
+    partes.append(b'\r')
+    return b''.join(partes)
+
+
+def escrever_dbf(destino, linhas, ano=2023, fracao_regiao=FRACAO_REGIAO, semente=0,
+                 registros_por_bloco=REGISTROS_POR_BLOCO):
+    """Escreve um DBF sintético com `linhas` registros no arquivo binário `destino`."""
+    gerador = np.random.default_rng(semente)
+    campos = _campos()
+    registro = np.dtype([('_marca', 'S1')] + [(nome, 'S%d' % largura) for nome, largura in campos])
+
+    destino.write(_cabecalho(campos, linhas))
+    for inicio in range(0, linhas, registros_por_bloco):
+        quantidade = min(registros_por_bloco, linhas - inicio)
+        valores = gerar_bloco(gerador, quantidade, inicio, ano, fracao_regiao)
+        bloco = np.zeros(quantidade, dtype=registro)
+        bloco['_marca'] = np.where(gerador.random(quantidade) < FRACAO_EXCLUIDOS, b'*', b' ')
+        for nome, _ in campos:
+            bloco[nome] = valores[nome]
+        # Os campos ficam completados com nulos; no DBF são completados com espaços
+        bytes_bloco = bloco.view(np.uint8)
+        bytes_bloco[bytes_bloco == 0] = ord(' ')
+        destino.write(bytes_bloco.tobytes())
+    destino.write(b'\x1a')
+
+
+def gerar_arquivo(caminho, linhas, ano=2023, fracao_regiao=FRACAO_REGIAO, semente=0):
+    """Gera `caminho` (.dbf, ou .zip com o DBF dentro) e devolve o caminho."""
+    if caminho.lower().endswith('.zip'):
+        nome_dbf = os.path.splitext(os.path.basename(caminho))[0] + '.dbf'
+        with zipfile.ZipFile(caminho, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zip_ref, \
+                zip_ref.open(nome_dbf, 'w', force_zip64=True) as destino:
+            escrever_dbf(destino, linhas, ano, fracao_regiao, semente)
+    else:
+        with open(caminho, 'wb') as destino:
+            escrever_dbf(destino, linhas, ano, fracao_regiao, semente)
+    return caminho
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Gera um arquivo DBF (ou ZIP) sintético do SIVEP-Gripe.')
+    parser.add_argument('caminho', help='arquivo a gerar, .dbf ou .zip')
+    parser.add_argument('--linhas', type=int, default=100000)
+    parser.add_argument('--ano', type=int, default=2023)
+    parser.add_argument('--fracao-regiao', type=float, default=FRACAO_REGIAO,
+                        help=f'fração das notificações da regional {REGIAO_PAINEL}')
+    parser.add_argument('--semente', type=int, default=0)
+    args = parser.parse_args(argv)
+    gerar_arquivo(args.caminho, args.linhas, args.ano, args.fracao_regiao, args.semente)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Cache dos arquivos já processados, indexado pelo hash do conteúdo.
+
+Os resultados ficam serializados em um diretório, que sobrevive a reinícios
+do servidor e é limitado em bytes; ao passar do limite, as entradas usadas
+há mais tempo são descartadas. Não há cópia em memória: os resultados em uso
+pelas sessões já ficam no repositório compartilhado (compartilhado.py).
+"""
+import hashlib
+import os
+import pickle
+import threading
+
+
+LIMITE_DISCO = 2 * 1024 ** 3
+
+
+def hash_conteudo(conteudo):
+    return hashlib.sha256(conteudo).hexdigest()
+
+
+def limpar_diretorio(diretorio, limite, extensao):
+    """Apaga os arquivos `extensao` modificados há mais tempo até o total caber em `limite` bytes.
+
+    O arquivo mais recente é sempre mantido.
+    """
+    arquivos = []
+    for nome in os.listdir(diretorio):
+        if not nome.endswith(extensao):
+            continue
+        try:
+            info = os.stat(os.path.join(diretorio, nome))
+        except FileNotFoundError:
+            continue
+        arquivos.append((info.st_mtime, info.st_size, nome))
+
+    total = sum(tamanho for _, tamanho, _ in arquivos)
+    for _, tamanho, nome in sorted(arquivos)[:-1]:
+        if total <= limite:
+            break
+        try:
+            os.remove(os.path.join(diretorio, nome))
+        except FileNotFoundError:
+            pass
+        total -= tamanho
+
+
+class CacheArquivos:
+    def __init__(self, diretorio, limite_disco=LIMITE_DISCO):
+        self.diretorio = diretorio
+        self.limite_disco = limite_disco
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, chave + '.pkl')
+
+    def obter(self, chave):
+        """Devolve o valor guardado em `chave`, ou None se não houver."""
+        caminho = self._caminho(chave)
+        try:
+            # Atualiza a data de modificação para a ordem de descarte do disco
+            os.utime(caminho)
+            with open(caminho, 'rb') as f:
+                serializado = f.read()
+        except FileNotFoundError:
+            # Ausente, ou descartado por outra sessão entre as duas operações
+            return None
+        return pickle.loads(serializado)
+
+    def guardar(self, chave, valor):
+        serializado = pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL)
+        caminho = self._caminho(chave)
+        temporario = caminho + '.%d.%d.tmp' % (os.getpid(), threading.get_ident())
+        with open(temporario, 'wb') as f:
+            f.write(serializado)
+        os.replace(temporario, caminho)
+        self._limpar_disco()
+
+    def _limpar_disco(self):
+        limpar_diretorio(self.diretorio, self.limite_disco, '.pkl')
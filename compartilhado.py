@@ -0,0 +1,136 @@
+"""
+Conjuntos de dados compartilhados, somente para leitura, entre as sessões do painel.
+
+Cada conjunto (por exemplo, o resultado do processamento de um grupo de
+arquivos) é identificado por uma chave derivada do conteúdo dos arquivos e é
+calculado uma única vez por processo, mesmo que várias sessões o peçam ao
+mesmo tempo. As sessões recebem uma referência ao mesmo objeto, sem cópia, e
+não devem alterá-lo.
+
+Cada referência conta como um uso do conjunto e é liberada explicitamente ou
+quando a sessão que a guarda deixa de existir. Conjuntos sem uso são
+descartados depois de um tempo inativos, ou antes, do mais antigo para o mais
+recente, quando o total passa do limite de memória.
+"""
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+
+
+LIMITE_MEMORIA = 2 * 1024 ** 3
+TEMPO_INATIVO = 30 * 60
+
+
+class _Entrada:
+    def __init__(self, valor, tamanho):
+        self.valor = valor
+        self.tamanho = tamanho
+        self.referencias = 0
+        self.ultimo_uso = time.monotonic()
+
+
+class Referencia:
+    """Uso de um conjunto compartilhado; liberado por `liberar()` ou quando o objeto é coletado."""
+
+    def __init__(self, repositorio, chave, valor):
+        self.chave = chave
+        self.valor = valor
+        self._finalizador = weakref.finalize(self, repositorio._liberar, chave)
+
+    @property
+    def ativa(self):
+        return self._finalizador.alive
+
+    def liberar(self):
+        self._finalizador()
+
+
+class RepositorioCompartilhado:
+    def __init__(self, limite_memoria=LIMITE_MEMORIA, tempo_inativo=TEMPO_INATIVO):
+        self.limite_memoria = limite_memoria
+        self.tempo_inativo = tempo_inativo
+        self._entradas = OrderedDict()
+        self._calculando = {}
+        self._pendentes = deque()
+        self._trava = threading.Lock()
+
+    def adquirir(self, chave, calcular, tamanho=None):
+        """Devolve uma Referencia ao valor de `chave`, calculando-o com `calcular()` se preciso.
+
+        Pedidos simultâneos da mesma chave esperam um único cálculo.
+        `tamanho(valor)` estima os bytes do valor, para o limite de memória.
+        """
+        while True:
+            with self._trava:
+                entrada = self._entradas.get(chave)
+                if entrada is not None:
+                    return self._referenciar(chave, entrada)
+                trava_chave = self._calculando.setdefault(chave, threading.Lock())
+
+            with trava_chave:
+                with self._trava:
+                    entrada = self._entradas.get(chave)
+                    if entrada is not None:
+                        return self._referenciar(chave, entrada)
+                    # Se o cálculo anterior falhou e outra sessão já recomeçou, espera por ela
+                    if self._calculando.setdefault(chave, trava_chave) is not trava_chave:
+                        continue
+                try:
+                    valor = calcular()
+                    entrada = _Entrada(valor, tamanho(valor) if tamanho is not None else 0)
+                except BaseException:
+                    with self._trava:
+                        self._parar_calculo(chave, trava_chave)
+                    raise
+                # A entrada aparece no mesmo instante em que a trava da chave sai
+                with self._trava:
+                    self._parar_calculo(chave, trava_chave)
+                    self._entradas[chave] = entrada
+                    return self._referenciar(chave, entrada)
+
+    def _parar_calculo(self, chave, trava_chave):
+        if self._calculando.get(chave) is trava_chave:
+            del self._calculando[chave]
+
+    def _referenciar(self, chave, entrada):
+        # Chamado com a trava adquirida, para que a entrada não seja descartada antes de contar o uso
+        entrada.referencias += 1
+        entrada.ultimo_uso = time.monotonic()
+        self._entradas.move_to_end(chave)
+        self._descartar()
+        return Referencia(self, chave, entrada.valor)
+
+    def _liberar(self, chave):
+        # O coletor de lixo pode chamar esta função na thread que já tem a trava; nesse caso, e
+        # quando outra thread a tem, a liberação fica pendente até a próxima seção crítica
+        self._pendentes.append(chave)
+        if self._trava.acquire(blocking=False):
+            try:
+                self._descartar()
+            finally:
+                self._trava.release()
+
+    def _descartar(self):
+        # Chamado com a trava adquirida; conjuntos em uso nunca são descartados
+        while self._pendentes:
+            entrada = self._entradas.get(self._pendentes.popleft())
+            if entrada is not None:
+                entrada.referencias -= 1
+                entrada.ultimo_uso = time.monotonic()
+        agora = time.monotonic()
+        total = sum(entrada.tamanho for entrada in self._entradas.values())
+        for chave, entrada in list(self._entradas.items()):
+            if entrada.referencias > 0:
+                continue
+            if total > self.limite_memoria or agora - entrada.ultimo_uso > self.tempo_inativo:
+                del self._entradas[chave]
+                total -= entrada.tamanho
+
+    def estatisticas(self):
+        """Número de conjuntos, bytes estimados e referências ativas."""
+        with self._trava:
+            self._descartar()
+            return {'conjuntos': len(self._entradas),
+                    'bytes': sum(entrada.tamanho for entrada in self._entradas.values()),
+                    'referencias': sum(entrada.referencias for entrada in self._entradas.values())}
@@ -0,0 +1 @@
+# Os testes importam os módulos do painel a partir da raiz do repositório (ver tests/)
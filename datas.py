@@ -0,0 +1,40 @@
+"""
+Datas do SIVEP: conversão dos campos texto e semanas epidemiológicas.
+"""
+import pandas as pd
+
+
+FORMATO_SIVEP = '%d/%m/%Y'
+
+
+def converter_datas(serie, formato=FORMATO_SIVEP):
+    """Converte datas no formato fixo do SIVEP (dd/mm/aaaa) para datetime64.
+
+    Há poucas datas distintas em relação ao número de notificações, então
+    cada valor distinto é convertido uma única vez. Valores vazios ou
+    inválidos viram NaT.
+    """
+    codigos, valores = pd.factorize(serie)
+    convertidos = pd.to_datetime(pd.Index(valores, dtype=object), format=formato, errors='coerce')
+    # codigos == -1 (valores ausentes) apontam para o NaT acrescentado no fim
+    convertidos = convertidos.append(pd.DatetimeIndex([pd.NaT]))
+    return pd.Series(convertidos.take(codigos).to_numpy(), index=serie.index)
+
+
+def semana_epidemiologica(datas):
+    """Devolve (ano, semana) epidemiológicos de uma Series de datas.
+
+    A semana epidemiológica vai de domingo a sábado e pertence ao ano em que
+    cai a sua quarta-feira; a semana 1 é a primeira com quarta-feira no ano.
+    """
+    quarta = datas - pd.to_timedelta((datas.dt.dayofweek + 1) % 7, unit='D') + pd.Timedelta(days=3)
+    return quarta.dt.year, (quarta.dt.dayofyear - 1) // 7 + 1
+
+
+def semanas_entre(inicio, fim):
+    """Lista as semanas epidemiológicas (como AAAASS) de `inicio` a `fim`, inclusive."""
+    domingos = pd.Series(pd.date_range(pd.Timestamp(inicio // 100 - 1, 12, 20),
+                                       pd.Timestamp(fim // 100 + 1, 1, 10), freq='W-SUN'))
+    ano, semana = semana_epidemiologica(domingos)
+    codigos = ano * 100 + semana
+    return codigos[(codigos >= inicio) & (codigos <= fim)].tolist()
@@ -0,0 +1,98 @@
+"""
+Dicionário de dados do SIVEP-Gripe usado pelo painel.
+
+Descreve, de forma declarativa, como cada campo do DBF aparece na tabela
+detalhada (nome da coluna e tradução dos códigos) e como são definidos os
+indicadores de vírus. Códigos que não constam do dicionário são mantidos
+como estão.
+"""
+
+CRITERIO = {'1': 'laboratorial',
+            '2': 'clinico-epidemiologico',
+            '3': 'clinico',
+            '4': 'clinico-imagem'}
+
+UTI = {'1': 'Sim', '2': 'Não', '9': 'Ignorado'}
+
+CLASSI_FIN = {'1': 'SRAG por influenza',
+              '2': 'SRAG por outro vírus respiratório',
+              '3': 'SRAG por outro agente etiológico',
+              '4': 'SRAG não especificado',
+              '5': 'SRAG por Covid-19',
+              '': 'Suspeito'}
+
+EVOLUCAO = {'1': 'Cura',
+            '2': 'Óbito',
+            '3': 'Óbito por outras causas',
+            '9': 'Ignorado',
+            '': 'Aguardando'}
+
+PCR_RESUL = {'1': 'Detectável',
+             '2': 'Não detectável',
+             '3': 'Inconclusivo',
+             '4': 'Não realizado',
+             '5': 'Aguardando resultado',
+             '9': 'Ignorado'}
+
+TP_FLU_PCR = {'1': 'Influenza A',
+              '2': 'Influenza B'}
+
+PCR_FLUASU = {'1': 'Influenza A (H1N1)',
+              '2': 'Influenza A (H3N2)',
+              '3': 'Influenza nao subtipado',
+              '4': 'Influenza nao subtipavel',
+              '5': 'Inconclusivo',
+              '6': 'outro'}
+
+PCR_FLUBLI = {'1': 'Victoria',
+              '2': 'Yamagatha',
+              '3': 'Nao realizado',
+              '4': 'Inconclusivo',
+              '5': 'outro'}
+
+# Campos marcados apenas quando o vírus foi detectado
+DETECTADO = {'1': 'sim'}
+
+# Colunas da tabela detalhada: (campo do SIVEP, nome da coluna, tradução dos códigos).
+# Campos com tradução, ou com poucos valores distintos, viram categorias;
+# `None` na tradução mantém os valores originais.
+COLUNAS_DETALHE = [
+    ('NM_PACIENT', 'nome', None),
+    ('ID_MN_RESI', 'municipio de residencia', {}),
+    ('ID_MUNICIP', 'municipo de notificacao', {}),
+    ('DT_NOTIFIC', 'data de notificacao', None),
+    ('DT_SIN_PRI', 'inicio dos sintomas', None),
+    ('UTI', 'Foi para UTI?', UTI),
+    ('DT_SAIDUTI', 'Data de saída da UTI', None),
+    ('CRITERIO', 'Critério de confirmação', CRITERIO),
+    ('CLASSI_FIN', 'Classificação final', CLASSI_FIN),
+    ('EVOLUCAO', 'Evolução', EVOLUCAO),
+    ('PCR_RESUL', 'Resultado outro PCR', PCR_RESUL),
+    ('TP_FLU_PCR', 'Tipo Influenza', TP_FLU_PCR),
+    ('PCR_FLUASU', 'subtipo Influenza A', PCR_FLUASU),
+    ('PCR_FLUBLI', 'subtipo Influenza B', PCR_FLUBLI),
+    ('PCR_VSR', 'VSR', DETECTADO),
+    ('PCR_PARA1', 'PARA1', DETECTADO),
+    ('PCR_PARA2', 'PARA2', DETECTADO),
+    ('PCR_PARA3', 'PARA3', DETECTADO),
+    ('PCR_PARA4', 'PARA4', DETECTADO),
+    ('PCR_ADENO', 'ADENO', DETECTADO),
+    ('PCR_RINO', 'RINO', DETECTADO),
+]
+
+# Indicadores de vírus: (coluna da tabela detalhada, valores que contam).
+# Nos vírus respiratórios o valor é comparado sem espaços e em minúsculas.
+INDICADORES = {
+    'COVID': ('Classificação final', ['SRAG por Covid-19']),
+    'INFLUENZA_A': ('Tipo Influenza', ['Influenza A']),
+    'INFLUENZA_A_H1N1': ('subtipo Influenza A', ['Influenza A (H1N1)']),
+    'INFLUENZA_A_H3N2': ('subtipo Influenza A', ['Influenza A (H3N2)']),
+    'INFLUENZA_B': ('Tipo Influenza', ['Influenza B']),
+    'INFLUENZA_B_VICTORIA': ('subtipo Influenza B', ['Victoria']),
+    'INFLUENZA_B_YAMAGATA': ('subtipo Influenza B', ['Yamagatha']),
+    'VSR': ('VSR', ['sim', '1']),
+    'ADENO': ('ADENO', ['sim', '1']),
+    'RINO': ('RINO', ['sim', '1']),
+}
+
+INDICADORES_NORMALIZADOS = ['VSR', 'ADENO', 'RINO']
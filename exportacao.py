@@ -0,0 +1,96 @@
+"""
+Exportação das tabelas para download em CSV, CSV compactado ou Parquet.
+
+Os arquivos só são gerados quando o download é pedido, e são escritos em
+blocos de linhas, sem montar o arquivo inteiro nem uma cópia da tabela
+filtrada na memória. Cada exportação fica em disco, indexada pela versão
+dos dados e pelos filtros usados, para ser reaproveitada em um novo download.
+"""
+import gzip
+import io
+import os
+import threading
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from cache import hash_conteudo, limpar_diretorio
+
+
+# Formato: (extensão do arquivo, tipo MIME)
+FORMATOS = {
+    'CSV': ('csv', 'text/csv'),
+    'CSV compactado (gzip)': ('csv.gz', 'application/gzip'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+LINHAS_POR_BLOCO = 50000
+LIMITE_DISCO = 1024 ** 3
+
+
+def _blocos(dados, posicoes, linhas_por_bloco):
+    posicoes = np.arange(len(dados)) if posicoes is None else posicoes
+    for inicio in range(0, max(len(posicoes), 1), linhas_por_bloco):
+        yield dados.iloc[posicoes[inicio:inicio + linhas_por_bloco]]
+
+
+def _escrever_csv(blocos, destino):
+    texto = io.TextIOWrapper(destino, encoding='utf-8', newline='')
+    for numero, bloco in enumerate(blocos):
+        bloco.to_csv(texto, index=False, header=numero == 0)
+    texto.flush()
+    texto.detach()
+
+
+def exportar(dados, destino, formato, posicoes=None, linhas_por_bloco=LINHAS_POR_BLOCO):
+    """Escreve as linhas `posicoes` (todas, se None) de `dados` no arquivo binário `destino`."""
+    blocos = _blocos(dados, posicoes, linhas_por_bloco)
+    if formato == 'CSV':
+        _escrever_csv(blocos, destino)
+    elif formato == 'CSV compactado (gzip)':
+        # Sem nome nem data no cabeçalho: o arquivo não leva o caminho temporário e é sempre o mesmo
+        with gzip.GzipFile(filename='', fileobj=destino, mode='wb', mtime=0) as compactado:
+            _escrever_csv(blocos, compactado)
+    elif formato == 'Parquet':
+        esquema = pa.Schema.from_pandas(dados, preserve_index=False)
+        with pq.ParquetWriter(destino, esquema) as escritor:
+            for bloco in blocos:
+                escritor.write_table(pa.Table.from_pandas(bloco, schema=esquema, preserve_index=False))
+    else:
+        raise ValueError(f'Formato de exportação desconhecido: {formato}')
+
+
+def chave_exportacao(*partes):
+    """Chave de uma exportação a partir da versão dos dados, dos filtros e do formato."""
+    return hash_conteudo(repr(partes).encode())
+
+
+class CacheExportacoes:
+    """Arquivos exportados em disco, descartados pela data de último uso."""
+
+    def __init__(self, diretorio, limite_disco=LIMITE_DISCO):
+        self.diretorio = diretorio
+        self.limite_disco = limite_disco
+        os.makedirs(diretorio, exist_ok=True)
+
+    def obter(self, chave, formato, dados, posicoes=None):
+        """Devolve o conteúdo da exportação, gerando o arquivo se ainda não existir."""
+        caminho = os.path.join(self.diretorio, f'{chave}.{FORMATOS[formato][0]}')
+        try:
+            os.utime(caminho)
+            with open(caminho, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            # Ainda não gerada, ou descartada por outra sessão entre a consulta e a leitura
+            pass
+
+        # O conteúdo é lido do arquivo temporário, antes que a limpeza do diretório possa descartá-lo
+        temporario = caminho + '.%d.%d.tmp' % (os.getpid(), threading.get_ident())
+        with open(temporario, 'w+b') as f:
+            exportar(dados, f, formato, posicoes)
+            f.seek(0)
+            conteudo = f.read()
+        os.replace(temporario, caminho)
+        limpar_diretorio(self.diretorio, self.limite_disco, tuple('.' + extensao for extensao, _ in FORMATOS.values()))
+        return conteudo
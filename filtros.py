@@ -0,0 +1,53 @@
+"""
+Índices para filtrar a tabela detalhada sem percorrer as notificações.
+
+Para cada coluna categórica filtrável, guarda um bitmap (compactado com
+`np.packbits`) por valor distinto. Uma combinação de filtros é resolvida pela
+interseção dos bitmaps escolhidos, e o resultado são as posições das linhas,
+na ordem da tabela, prontas para serem paginadas.
+"""
+import numpy as np
+
+
+COLUNAS_FILTRO = ['municipio de residencia', 'Classificação final', 'Evolução', 'Foi para UTI?']
+
+
+class IndiceCategorias:
+    """Bitmaps por valor das colunas categóricas de uma tabela.
+
+    O índice vale para a tabela com que foi construído; a carga constrói um
+    novo índice a cada atualização.
+    """
+
+    def __init__(self, dados, colunas=COLUNAS_FILTRO):
+        self.linhas = len(dados)
+        self.bitmaps = {}
+        for coluna in colunas:
+            serie = dados[coluna].astype('category')
+            codigos = serie.cat.codes.to_numpy()
+            presentes = np.flatnonzero(np.bincount(codigos[codigos >= 0], minlength=len(serie.cat.categories)))
+            self.bitmaps[coluna] = {
+                serie.cat.categories[codigo]: np.packbits(codigos == codigo) for codigo in presentes
+            }
+
+    def valores(self, coluna):
+        """Valores presentes na coluna, em ordem alfabética."""
+        return sorted(self.bitmaps[coluna])
+
+    def filtrar(self, selecao):
+        """Posições das linhas que atendem a todos os filtros de `selecao` ({coluna: valor})."""
+        resultado = None
+        for coluna, valor in selecao.items():
+            bitmap = self.bitmaps[coluna].get(valor)
+            if bitmap is None:
+                return np.empty(0, dtype=np.intp)
+            resultado = bitmap if resultado is None else resultado & bitmap
+        if resultado is None:
+            return np.arange(self.linhas)
+        return np.flatnonzero(np.unpackbits(resultado, count=self.linhas))
+
+
+def paginar(posicoes, pagina, tamanho):
+    """Posições da página `pagina` (a partir de 1) com `tamanho` linhas."""
+    inicio = (pagina - 1) * tamanho
+    return posicoes[inicio:inicio + tamanho]
@@ -0,0 +1,128 @@
+"""
+Atualização incremental das cargas semanais do SIVEP.
+
+O SIVEP republica toda semana o arquivo do ano corrente, e a maior parte das
+notificações não muda. Cada notificação é identificada por uma chave estável
+(número da notificação e município notificador) e por uma assinatura do
+conteúdo da linha. Ao comparar uma nova carga com a anterior, só as
+notificações novas, alteradas ou removidas são decodificadas e os agregados
+por município são corrigidos com essas diferenças.
+"""
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from cache import hash_conteudo
+from instrumentacao import etapa
+from processamento import agregar, combinar, combinar_cubos, concatenar, cubo_semanal, decodificar
+
+
+CHAVE_REGISTRO = ['NU_NOTIFIC', 'ID_MUNICIP']
+
+
+def _chaves(dados):
+    base = dados[CHAVE_REGISTRO]
+    # Chaves repetidas são diferenciadas pela ordem de ocorrência
+    ocorrencia = base.groupby(CHAVE_REGISTRO, sort=False, dropna=False, observed=True).cumcount()
+    return pd.util.hash_pandas_object(base.assign(_ocorrencia=ocorrencia), index=False).to_numpy()
+
+
+def _assinaturas(dados):
+    return pd.util.hash_pandas_object(dados, index=False).to_numpy()
+
+
+class CargaIncremental:
+    """Dados de uma carga já processada, prontos para serem atualizados.
+
+    `dados_geral` tem índice posicional (0..n-1) e `dados_consolidados2`
+    preserva esse índice, o que permite localizar as linhas de cada notificação.
+    """
+
+    def __init__(self, dados_geral, dados_consolidados2, matriz, cubo, chaves=None, assinaturas=None, regiao=None,
+                 municipios=()):
+        self.dados_geral = dados_geral
+        self.dados_consolidados2 = dados_consolidados2
+        self.matriz = matriz
+        self.cubo = cubo
+        self.chaves = _chaves(dados_geral) if chaves is None else chaves
+        self.assinaturas = _assinaturas(dados_geral) if assinaturas is None else assinaturas
+        self.regiao = regiao
+        self.municipios = municipios
+
+    @cached_property
+    def versao(self):
+        """Identifica o conteúdo da carga, para as chaves dos caches derivados dela."""
+        return hash_conteudo(self.chaves.tobytes() + self.assinaturas.tobytes())
+
+    @classmethod
+    def completa(cls, dados_geral, medicoes=None, regiao=None, municipios=()):
+        dados_geral = dados_geral.reset_index(drop=True)
+        with etapa(medicoes, 'decodificacao', len(dados_geral)) as registro:
+            dados_consolidados2 = decodificar(dados_geral, regiao)
+            registro['linhas_saida'] = len(dados_consolidados2)
+        with etapa(medicoes, 'agregacao', len(dados_consolidados2)) as registro:
+            matriz = agregar(dados_consolidados2, municipios)
+            registro['linhas_saida'] = len(matriz)
+        with etapa(medicoes, 'cubo_semanal', len(dados_consolidados2)) as registro:
+            cubo = cubo_semanal(dados_consolidados2)
+            registro['linhas_saida'] = len(cubo)
+        with etapa(medicoes, 'assinaturas', len(dados_geral)):
+            return cls(dados_geral, dados_consolidados2, matriz, cubo, regiao=regiao, municipios=municipios)
+
+    @staticmethod
+    def suporta(dados_geral):
+        # O MontadorTabela cria as colunas que faltam no extrato, vazias: sem o número da
+        # notificação, as chaves seriam só o município e a ordem de ocorrência
+        return (all(coluna in dados_geral.columns for coluna in CHAVE_REGISTRO)
+                and bool((dados_geral['NU_NOTIFIC'] != '').any()))
+
+    def atualizar(self, dados_geral, medicoes=None):
+        """Devolve (nova carga, resumo das mudanças) em relação a esta carga."""
+        dados_geral = dados_geral.reset_index(drop=True)
+        if list(dados_geral.columns) != list(self.dados_geral.columns):
+            return CargaIncremental.completa(dados_geral, medicoes, self.regiao, self.municipios), None
+
+        with etapa(medicoes, 'assinaturas', len(dados_geral)):
+            chaves = _chaves(dados_geral)
+            assinaturas = _assinaturas(dados_geral)
+        if np.array_equal(chaves, self.chaves) and np.array_equal(assinaturas, self.assinaturas):
+            return self, {'novos': 0, 'alterados': 0, 'removidos': 0, 'municipios': []}
+
+        anteriores = pd.Series(self.assinaturas, index=self.chaves)
+        existia = np.isin(chaves, self.chaves)
+        alterado = existia & (anteriores.reindex(chaves).to_numpy() != assinaturas)
+        entram = ~existia | alterado
+
+        # Linhas da carga anterior que saem: removidas ou substituídas por uma versão nova
+        continua = np.isin(self.chaves, chaves)
+        saem = ~continua | np.isin(self.chaves, chaves[alterado])
+
+        decodificados_saem = self.dados_consolidados2.loc[saem[self.dados_consolidados2.index]]
+        with etapa(medicoes, 'decodificacao', int(entram.sum())) as registro:
+            decodificados_entram = decodificar(dados_geral[entram], self.regiao)
+            registro['linhas_saida'] = len(decodificados_entram)
+        with etapa(medicoes, 'agregacao', len(decodificados_saem) + len(decodificados_entram)) as registro:
+            matriz = combinar(self.matriz, agregar(decodificados_saem, self.municipios), -1, self.municipios)
+            matriz = combinar(matriz, agregar(decodificados_entram, self.municipios), municipios=self.municipios)
+            registro['linhas_saida'] = len(matriz)
+        with etapa(medicoes, 'cubo_semanal', len(decodificados_saem) + len(decodificados_entram)) as registro:
+            cubo = combinar_cubos(self.cubo, cubo_semanal(decodificados_saem), -1)
+            cubo = combinar_cubos(cubo, cubo_semanal(decodificados_entram))
+            registro['linhas_saida'] = len(cubo)
+
+        # As linhas mantidas recebem a posição que têm na nova carga
+        with etapa(medicoes, 'tabela_detalhada', len(self.dados_consolidados2)) as registro:
+            mantidos = self.dados_consolidados2.loc[~saem[self.dados_consolidados2.index]].copy()
+            mantidos.index = pd.Index(chaves).get_indexer(self.chaves[mantidos.index])
+            dados_consolidados2 = concatenar([mantidos, decodificados_entram]).sort_index()
+            dados_consolidados2 = dados_consolidados2.sort_values(by='data de notificacao', kind='stable')
+            registro['linhas_saida'] = len(dados_consolidados2)
+
+        municipios = (set(decodificados_saem['municipio de residencia'].unique())
+                      | set(decodificados_entram['municipio de residencia'].unique()))
+        resumo = {'novos': int((~existia).sum()), 'alterados': int(alterado.sum()),
+                  'removidos': int((~continua).sum()), 'municipios': sorted(municipios)}
+
+        return CargaIncremental(dados_geral, dados_consolidados2, matriz, cubo, chaves, assinaturas, self.regiao,
+                                self.municipios), resumo
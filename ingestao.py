@@ -0,0 +1,407 @@
+"""
+Leitura em streaming dos arquivos DBF do SIVEP-Gripe.
+
+Os arquivos nacionais têm milhões de registros, mas o painel só usa as
+notificações de uma regional e cerca de vinte colunas. Em vez de montar um
+DataFrame com o arquivo inteiro, os registros são lidos em lotes de tamanho
+fixo, o filtro de regional é aplicado sobre os bytes brutos e só as colunas
+necessárias das linhas selecionadas são decodificadas.
+"""
+import hashlib
+import os
+import zipfile
+import zlib
+from io import BytesIO
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+from dbfread.dbf import DBFHeader, DBFField
+from dbfread.field_parser import FieldParser
+from pandas.api.types import union_categoricals
+
+from instrumentacao import etapa
+
+
+REGIAO_PADRAO = '014 CRS'
+COLUNA_REGIAO = 'ID_RG_RESI'
+
+# Colunas do SIVEP usadas em alguma parte do painel
+COLUNAS_SIVEP = ['NU_NOTIFIC', 'NM_PACIENT', 'ID_MN_RESI', 'ID_MUNICIP', 'ID_RG_RESI', 'DT_NOTIFIC', 'DT_SIN_PRI', 'CRITERIO',
+                 'UTI', 'DT_SAIDUTI', 'CLASSI_FIN', 'EVOLUCAO', 'DT_EVOLUCAO', 'PCR_RESUL', 'TP_FLU_PCR',
+                 'PCR_FLUASU', 'PCR_FLUBLI', 'PCR_VSR', 'PCR_PARA1', 'PCR_PARA2', 'PCR_PARA3', 'PCR_PARA4',
+                 'PCR_ADENO', 'PCR_RINO']
+
+# Tipos da tabela geral: colunas com poucos valores distintos (códigos, regionais,
+# municípios e datas) viram categorias; o número e o nome do paciente, não
+ESQUEMA_SIVEP = {coluna: object if coluna in ('NU_NOTIFIC', 'NM_PACIENT') else 'category' for coluna in COLUNAS_SIVEP}
+
+REGISTROS_POR_LOTE = 20000
+
+
+def ler_cabecalho(arquivo, encoding='latin-1'):
+    """Lê o cabeçalho do DBF e devolve (cabecalho, campos).
+
+    Cada campo recebe o atributo `deslocamento`, a posição do campo dentro
+    do registro (o primeiro byte do registro é a marca de exclusão).
+    """
+    cabecalho = DBFHeader.read(arquivo)
+    campos = []
+    lidos = DBFHeader.size
+    deslocamento = 1
+    while True:
+        separador = arquivo.read(1)
+        lidos += 1
+        if separador in (b'\r', b'\n', b''):
+            break
+        campo = DBFField.unpack(separador + arquivo.read(DBFField.size - 1))
+        lidos += DBFField.size - 1
+        campo.type = chr(ord(campo.type))
+        # Campos de texto maiores que 255 bytes guardam o byte alto em decimal_count
+        if campo.type == 'C':
+            campo.length |= campo.decimal_count << 8
+            campo.decimal_count = 0
+        campo.name = campo.name.split(b'\0')[0].decode(encoding).upper()
+        campo.deslocamento = deslocamento
+        deslocamento += campo.length
+        campos.append(campo)
+
+    # Pular o restante do cabeçalho até o primeiro registro
+    if cabecalho.headerlen > lidos:
+        arquivo.read(cabecalho.headerlen - lidos)
+    return cabecalho, campos
+
+
+def _ler_exato(arquivo, tamanho):
+    # Fluxos (como os membros de um ZIP) podem devolver menos bytes por leitura
+    partes = []
+    while tamanho > 0:
+        parte = arquivo.read(tamanho)
+        if not parte:
+            break
+        partes.append(parte)
+        tamanho -= len(parte)
+    return partes[0] if len(partes) == 1 else b''.join(partes)
+
+
+def _decodificar(valores, encoding):
+    # Mesmo tratamento do dbfread para campos de texto: remove espaços e nulos à direita.
+    # Cada valor distinto do lote é decodificado uma vez e as linhas repetidas
+    # compartilham o mesmo objeto str
+    unicos, inversos = np.unique(valores, return_inverse=True)
+    textos = np.array([valor.rstrip(b'\0 ').decode(encoding) for valor in unicos.tolist()], dtype=object)
+    return textos[inversos].tolist()
+
+
+def _conversor(cabecalho, campos, encoding):
+    """FieldParser do dbfread para os `campos` que não são de texto, ou None se todos forem.
+
+    Esses campos (números, datas, lógicos) são convertidos valor a valor, como
+    na leitura com `DBF(...)`; campos memo vêm como None, como com
+    `ignore_missing_memofile=True`. Tipos que o dbfread não conhece são um erro.
+    """
+    if all(campo.type == 'C' for campo in campos):
+        return None
+    conversor = FieldParser(SimpleNamespace(header=cabecalho, encoding=encoding, char_decode_errors='strict'))
+    for campo in campos:
+        if not conversor.field_type_supported(campo.type):
+            raise ValueError('Campo %s de tipo %r não suportado' % (campo.name, campo.type))
+    return conversor
+
+
+def _converter(conversor, campo, valores):
+    # O numpy remove os nulos à direita dos valores 'S'; os campos binários precisam deles
+    return [conversor.parse(campo, valor.ljust(campo.length, b'\0')) for valor in valores.tolist()]
+
+
+def iterar_lotes(arquivo, regiao=REGIAO_PADRAO, colunas=COLUNAS_SIVEP, encoding='latin-1',
+                 registros_por_lote=REGISTROS_POR_LOTE):
+    """Percorre o DBF em lotes, devolvendo um dicionário {coluna: valores} por lote.
+
+    `arquivo` é um objeto binário com `read()`. Só as linhas cuja regional de
+    residência é `regiao` (ou está na lista `regiao`) são decodificadas; com
+    `regiao=None` todas são mantidas. Colunas ausentes no arquivo são
+    ignoradas, como no `DataFrame.filter`. Os valores são os mesmos da
+    leitura com `DBF(...)`: texto para campos 'C' e, para os demais tipos, o
+    valor convertido pelo dbfread.
+    """
+    cabecalho, campos = ler_cabecalho(arquivo, encoding)
+    por_nome = {campo.name: campo for campo in campos}
+    selecionadas = [coluna for coluna in colunas if coluna in por_nome]
+    conversor = _conversor(cabecalho, [por_nome[coluna] for coluna in selecionadas], encoding)
+
+    nomes = ['_marca'] + selecionadas
+    formatos = ['S1'] + ['S%d' % por_nome[coluna].length for coluna in selecionadas]
+    deslocamentos = [0] + [por_nome[coluna].deslocamento for coluna in selecionadas]
+    if regiao is not None:
+        if COLUNA_REGIAO not in por_nome:
+            return
+        campo_regiao = por_nome[COLUNA_REGIAO]
+        nomes.append('_regiao')
+        formatos.append('S%d' % campo_regiao.length)
+        deslocamentos.append(campo_regiao.deslocamento)
+        alvos = [alvo.encode(encoding) for alvo in ([regiao] if isinstance(regiao, str) else regiao)]
+    registro = np.dtype({'names': nomes, 'formats': formatos, 'offsets': deslocamentos,
+                         'itemsize': cabecalho.recordlen})
+
+    restantes = cabecalho.numrecords
+    while restantes > 0:
+        quantidade = min(restantes, registros_por_lote)
+        dados = _ler_exato(arquivo, quantidade * cabecalho.recordlen)
+        quantidade = len(dados) // cabecalho.recordlen
+        if quantidade == 0:
+            break
+        restantes -= quantidade
+
+        lote = np.frombuffer(dados, dtype=registro, count=quantidade)
+        # Registros excluídos são marcados com '*'
+        mascara = lote['_marca'] == b' '
+        if regiao is not None:
+            regioes_lote = np.char.rstrip(lote['_regiao'], b' ')
+            mascara &= regioes_lote == alvos[0] if len(alvos) == 1 else np.isin(regioes_lote, alvos)
+        lote = lote[mascara]
+        yield {coluna: _decodificar(lote[coluna], encoding) if por_nome[coluna].type == 'C'
+               else _converter(conversor, por_nome[coluna], lote[coluna]) for coluna in selecionadas}
+
+
+def ler_dbf(arquivo, regiao=REGIAO_PADRAO, colunas=COLUNAS_SIVEP, encoding='latin-1'):
+    """Lê um DBF do SIVEP já filtrado pela regional e projetado nas colunas usadas.
+
+    `arquivo` pode ser um caminho ou um objeto binário aberto.
+    """
+    if isinstance(arquivo, (str, bytes)) or hasattr(arquivo, '__fspath__'):
+        with open(arquivo, 'rb') as f:
+            return ler_dbf(f, regiao, colunas, encoding)
+
+    lotes = list(iterar_lotes(arquivo, regiao, colunas, encoding))
+    if not lotes:
+        return pd.DataFrame()
+    return pd.DataFrame({coluna: [valor for lote in lotes for valor in lote[coluna]] for coluna in lotes[0]})
+
+
+def ler_dbf_regioes(arquivo, regioes=None, colunas=COLUNAS_SIVEP, encoding='latin-1'):
+    """Lê o DBF uma única vez e devolve {regional: DataFrame}, o mesmo que `ler_dbf` para cada uma.
+
+    Cada lote é dividido pela regional de residência assim que é lido; o
+    arquivo inteiro nunca é montado em um único DataFrame. Com
+    `regioes=None`, devolve todas as regionais presentes no arquivo.
+    """
+    if regioes is not None and len(regioes) == 1:
+        return {regioes[0]: ler_dbf(arquivo, regioes[0], colunas, encoding)}
+    if isinstance(arquivo, (str, bytes)) or hasattr(arquivo, '__fspath__'):
+        with open(arquivo, 'rb') as f:
+            return ler_dbf_regioes(f, regioes, colunas, encoding)
+
+    # A coluna da regional é lida para a partição, mesmo que não tenha sido pedida
+    leitura = list(colunas) if COLUNA_REGIAO in colunas else list(colunas) + [COLUNA_REGIAO]
+    selecionadas = None
+    partes = {}
+    for lote in iterar_lotes(arquivo, regioes, leitura, encoding):
+        selecionadas = [coluna for coluna in lote if coluna in colunas]
+        codigos, valores = pd.factorize(np.asarray(lote[COLUNA_REGIAO], dtype=object))
+        lote = {coluna: np.asarray(lote[coluna], dtype=object) for coluna in selecionadas}
+        for indice, regiao in enumerate(valores):
+            linhas = np.flatnonzero(codigos == indice)
+            destino = partes.setdefault(regiao, {coluna: [] for coluna in selecionadas})
+            for coluna in selecionadas:
+                destino[coluna].extend(lote[coluna][linhas].tolist())
+
+    # Sem nenhum lote, como em `ler_dbf`, o DataFrame vazio não tem colunas
+    vazio = {coluna: np.array([], dtype=object) for coluna in selecionadas} if selecionadas is not None else {}
+    return {regiao: pd.DataFrame(partes.pop(regiao, vazio))
+            for regiao in (regioes if regioes is not None else sorted(partes))}
+
+
+def _hash_membro(zip_ref, nome):
+    h = hashlib.sha256()
+    with zip_ref.open(nome) as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 ** 2), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+class _LeitorComHash:
+    """Repassa as leituras de `arquivo` e calcula o SHA-256 do que foi lido."""
+
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+        self._hash = hashlib.sha256()
+
+    def read(self, tamanho=-1):
+        dados = self.arquivo.read(tamanho)
+        self._hash.update(dados)
+        return dados
+
+    def hexdigest(self):
+        # O que a leitura dos registros deixou (a marca de fim de arquivo) também entra no hash
+        for _ in iter(lambda: self.read(1024 ** 2), b''):
+            pass
+        return self._hash.hexdigest()
+
+
+def ler_membro_regioes(conteudo, nome, regioes, colunas=COLUNAS_SIVEP, encoding='latin-1', com_hash=False):
+    """Lê um DBF de dentro do ZIP (em memória), descompactando-o aos poucos, e devolve {regional: DataFrame}.
+
+    Com `com_hash`, devolve (hash do DBF, {regional: DataFrame}), com o hash
+    calculado na mesma descompactação da leitura.
+    """
+    with zipfile.ZipFile(BytesIO(conteudo), 'r') as zip_ref, zip_ref.open(nome) as arquivo:
+        if not com_hash:
+            return ler_dbf_regioes(arquivo, regioes, colunas, encoding)
+        leitor = _LeitorComHash(arquivo)
+        partes = ler_dbf_regioes(leitor, regioes, colunas, encoding)
+        return leitor.hexdigest(), partes
+
+
+def ler_zips_regioes(conteudos, regioes, colunas=COLUNAS_SIVEP, encoding='latin-1', armazem=None, executor=None,
+                     medicoes=None):
+    """Lê vários ZIPs e devolve, na mesma ordem, um {regional: {nome do DBF: DataFrame}} para cada um.
+
+    Cada DBF é decodificado uma única vez e dividido pelas `regioes` de
+    residência; para os demais parâmetros, ver `ler_zips`. Com um `armazem`,
+    um DBF só é decodificado se faltar alguma das regionais pedidas.
+    """
+    # Um DBF cujo CRC-32 e tamanho (do diretório do ZIP) não estão no armazém é novo: o hash
+    # dele é calculado durante a leitura, sem uma descompactação só para isso
+    assinaturas = armazem.assinaturas() if armazem is not None else None
+    membros = []
+    with etapa(medicoes, 'inventario_zips'):
+        for indice, conteudo in enumerate(conteudos):
+            with zipfile.ZipFile(BytesIO(conteudo), 'r') as zip_ref:
+                for info in zip_ref.infolist():
+                    if info.is_dir() or not info.filename.lower().endswith('.dbf'):
+                        continue
+                    talvez_armazenado = assinaturas is not None and (info.CRC, info.file_size) in assinaturas
+                    hash_dbf = _hash_membro(zip_ref, info.filename) if talvez_armazenado else None
+                    membros.append((indice, info, hash_dbf))
+
+    pendentes = [membro for membro in membros
+                 if membro[2] is None or not all(armazem.contem(membro[2], regiao, colunas) for regiao in regioes)]
+    com_hash = [armazem is not None and hash_dbf is None for _, _, hash_dbf in pendentes]
+    argumentos = ([conteudos[indice] for indice, _, _ in pendentes], [info.filename for _, info, _ in pendentes],
+                  [regioes] * len(pendentes), [colunas] * len(pendentes), [encoding] * len(pendentes), com_hash)
+    # Os DBFs lidos em outros processos não entram no pico de memória medido
+    with etapa(medicoes, 'leitura_dbf') as registro:
+        if executor is not None and len(pendentes) > 1:
+            lidos = executor.map(ler_membro_regioes, *argumentos)
+        else:
+            lidos = map(ler_membro_regioes, *argumentos)
+        decodificados = {}
+        for (indice, info, _), calculado, lido in zip(pendentes, com_hash, lidos):
+            decodificados[(indice, info.filename)] = lido if calculado else (None, lido)
+        registro['linhas_saida'] = sum(len(dados) for _, partes in decodificados.values() for dados in partes.values())
+
+    # Os DBFs decodificados agora são usados como estão; os demais são lidos do armazém
+    resultados = [{regiao: {} for regiao in regioes} for _ in conteudos]
+    with etapa(medicoes, 'armazem') as registro:
+        for indice, info, hash_dbf in membros:
+            # O caminho completo dentro do ZIP: DBFs de mesmo nome em pastas diferentes não se sobrepõem
+            nome_dbf = info.filename
+            hash_calculado, partes = decodificados.get((indice, info.filename), (None, None))
+            hash_dbf = hash_dbf or hash_calculado
+            for regiao in regioes:
+                if partes is None:
+                    resultados[indice][regiao][nome_dbf] = armazem.ler(hash_dbf, regiao, colunas)
+                    continue
+                if armazem is not None and not armazem.contem(hash_dbf, regiao, colunas):
+                    armazem.gravar(hash_dbf, nome_dbf, regiao, partes[regiao], colunas, info.CRC, info.file_size)
+                resultados[indice][regiao][nome_dbf] = partes[regiao]
+        registro['linhas_saida'] = sum(len(dados) for por_regiao in resultados for arquivos in por_regiao.values()
+                                       for dados in arquivos.values())
+    return resultados
+
+
+def ler_zips(conteudos, regiao=REGIAO_PADRAO, colunas=COLUNAS_SIVEP, encoding='latin-1', armazem=None,
+             executor=None, medicoes=None):
+    """Lê vários ZIPs e devolve, na mesma ordem, um {nome do DBF: DataFrame} para cada um.
+
+    Os DBFs são lidos direto dos membros do ZIP em memória, sem extração
+    para o disco. Com um `armazem` (ArmazemColunar), DBFs já convertidos são
+    lidos do Parquet e os novos são gravados nele após a decodificação. Com
+    um `executor` (por exemplo um ProcessPoolExecutor), os DBFs a decodificar
+    são lidos em paralelo; o resultado é o mesmo da leitura sequencial.
+    """
+    return [por_regiao[regiao] for por_regiao in ler_zips_regioes(conteudos, [regiao], colunas, encoding, armazem,
+                                                                  executor, medicoes)]
+
+
+def _assinatura_arquivo(caminho):
+    """(SHA-256, CRC-32, tamanho em bytes) do arquivo, como os de um DBF dentro do ZIP."""
+    h = hashlib.sha256()
+    crc = tamanho = 0
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 ** 2), b''):
+            h.update(bloco)
+            crc = zlib.crc32(bloco, crc)
+            tamanho += len(bloco)
+    return h.hexdigest(), crc, tamanho
+
+
+def ler_dbfs_regioes(caminhos, regioes, colunas=COLUNAS_SIVEP, encoding='latin-1', armazem=None, executor=None,
+                     medicoes=None):
+    """Lê vários DBFs soltos e devolve, na mesma ordem, um {regional: DataFrame} para cada um.
+
+    Como em `ler_zips_regioes`, com um `armazem` um DBF só é decodificado se
+    faltar alguma das regionais pedidas, e é gravado nele em seguida.
+    """
+    with etapa(medicoes, 'leitura_dbf_soltos') as registro:
+        assinaturas = [_assinatura_arquivo(caminho) if armazem is not None else None for caminho in caminhos]
+        pendentes = [indice for indice, assinatura in enumerate(assinaturas) if assinatura is None
+                     or not all(armazem.contem(assinatura[0], regiao, colunas) for regiao in regioes)]
+        leitura = executor.map if executor is not None and len(pendentes) > 1 else map
+        decodificados = dict(zip(pendentes, leitura(ler_dbf_regioes, [caminhos[indice] for indice in pendentes],
+                                                    [regioes] * len(pendentes), [colunas] * len(pendentes),
+                                                    [encoding] * len(pendentes))))
+        registro['linhas_saida'] = sum(len(dados) for partes in decodificados.values() for dados in partes.values())
+
+    resultados = []
+    with etapa(medicoes, 'armazem_dbf_soltos') as registro:
+        for indice, caminho in enumerate(caminhos):
+            partes = decodificados.get(indice)
+            if partes is None:
+                hash_dbf = assinaturas[indice][0]
+                partes = {regiao: armazem.ler(hash_dbf, regiao, colunas) for regiao in regioes}
+            elif armazem is not None:
+                hash_dbf, crc, tamanho = assinaturas[indice]
+                for regiao in regioes:
+                    if not armazem.contem(hash_dbf, regiao, colunas):
+                        armazem.gravar(hash_dbf, os.path.basename(caminho), regiao, partes[regiao], colunas, crc,
+                                       tamanho)
+            resultados.append(partes)
+        registro['linhas_saida'] = sum(len(dados) for partes in resultados for dados in partes.values())
+    return resultados
+
+
+class MontadorTabela:
+    """Junta as tabelas de vários arquivos em uma só, concatenando uma única vez.
+
+    Cada tabela é ajustada ao esquema ao ser adicionada: colunas ausentes no
+    arquivo ficam vazias, colunas fora do esquema são descartadas e os tipos
+    são convertidos. O custo total é linear no número de arquivos.
+    """
+
+    def __init__(self, esquema=ESQUEMA_SIVEP):
+        self.esquema = esquema
+        self.partes = []
+
+    def adicionar(self, dados):
+        colunas = {}
+        for coluna, tipo in self.esquema.items():
+            serie = dados[coluna] if coluna in dados.columns else pd.Series('', index=dados.index, dtype=object)
+            colunas[coluna] = serie.astype(tipo)
+        self.partes.append(pd.DataFrame(colunas, index=dados.index))
+
+    def montar(self):
+        """Devolve a tabela com todas as partes, na ordem em que foram adicionadas."""
+        if not self.partes:
+            return pd.DataFrame({coluna: pd.Series(dtype=tipo) for coluna, tipo in self.esquema.items()})
+
+        colunas = {}
+        for coluna, tipo in self.esquema.items():
+            series = [parte[coluna] for parte in self.partes]
+            if tipo == 'category':
+                colunas[coluna] = union_categoricals(series)
+            else:
+                colunas[coluna] = np.concatenate([serie.to_numpy() for serie in series])
+        indice = self.partes[0].index.append([parte.index for parte in self.partes[1:]])
+        return pd.DataFrame(colunas, index=indice)
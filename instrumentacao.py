@@ -0,0 +1,123 @@
+"""
+Medição do tempo e da memória de cada etapa do processamento.
+
+Uma execução (o processamento de uma carga) é acompanhada por um objeto
+`Medicoes`. Cada etapa registra o tempo de parede, as linhas de entrada e
+de saída e o pico de memória residente do processo durante a etapa. Cada
+etapa também é registrada no log `srag.desempenho` como uma linha JSON, pronta
+para ser enviada a um repositório de métricas.
+
+As funções do processamento recebem `medicoes=None`; sem medições, as
+etapas são executadas normalmente, sem nenhum custo.
+"""
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+
+logger = logging.getLogger('srag.desempenho')
+
+INTERVALO_AMOSTRAGEM = 0.005
+
+
+def rss_atual():
+    """Memória residente atual do processo, em bytes (Linux; nos demais, o pico até agora)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico if sys.platform == 'darwin' else pico * 1024
+
+
+class AmostradorRSS(threading.Thread):
+    """Amostra a memória residente em segundo plano e guarda o maior valor."""
+
+    def __init__(self, intervalo=INTERVALO_AMOSTRAGEM):
+        super().__init__(daemon=True)
+        self.intervalo = intervalo
+        self.pico = rss_atual()
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(self.intervalo):
+            self.pico = max(self.pico, rss_atual())
+
+    def encerrar(self):
+        self._parar.set()
+        self.join()
+        self.pico = max(self.pico, rss_atual())
+        return self.pico
+
+
+class Medicoes:
+    """Etapas medidas de uma execução, na ordem em que terminaram."""
+
+    def __init__(self, contexto=None):
+        self.execucao = uuid.uuid4().hex[:12]
+        self.contexto = contexto or {}
+        self.etapas = []
+
+    @contextmanager
+    def etapa(self, nome, entrada=None):
+        """Mede o bloco; quem o executa informa as linhas de saída em `registro['linhas_saida']`."""
+        registro = {'etapa': nome, 'linhas_entrada': entrada, 'linhas_saida': None}
+        inicial = rss_atual()
+        amostrador = AmostradorRSS()
+        amostrador.start()
+        inicio = time.perf_counter()
+        try:
+            yield registro
+        finally:
+            registro['tempo'] = round(time.perf_counter() - inicio, 4)
+            registro['pico_rss'] = amostrador.encerrar()
+            registro['acrescimo_rss'] = registro['pico_rss'] - inicial
+            self.etapas.append(registro)
+            logger.info(json.dumps({'evento': 'etapa', 'execucao': self.execucao,
+                                    'horario': datetime.now().isoformat(timespec='milliseconds'),
+                                    **self.contexto, **registro}, ensure_ascii=False))
+
+    def tempo_total(self):
+        return sum(registro['tempo'] for registro in self.etapas)
+
+    def tabela(self):
+        """Etapas em um DataFrame, com a memória em MB, para exibição."""
+        tabela = pd.DataFrame(self.etapas, columns=['etapa', 'tempo', 'linhas_entrada', 'linhas_saida', 'pico_rss',
+                                                    'acrescimo_rss'])
+        for coluna in ['linhas_entrada', 'linhas_saida']:
+            tabela[coluna] = tabela[coluna].astype('Int64')
+        for coluna in ['pico_rss', 'acrescimo_rss']:
+            tabela[coluna] = (tabela[coluna] / 1024 ** 2).round(1)
+        return tabela.rename(columns={'tempo': 'tempo (s)', 'linhas_entrada': 'linhas de entrada',
+                                      'linhas_saida': 'linhas de saída', 'pico_rss': 'pico de memória (MB)',
+                                      'acrescimo_rss': 'acréscimo (MB)'})
+
+
+@contextmanager
+def etapa(medicoes, nome, entrada=None):
+    """Como `Medicoes.etapa`, mas sem efeito quando `medicoes` é None."""
+    if medicoes is None:
+        yield {}
+        return
+    with medicoes.etapa(nome, entrada) as registro:
+        yield registro
+
+
+def configurar_log(destino=None):
+    """Envia o log de desempenho, uma linha JSON por etapa, para o arquivo `destino` (ou stderr)."""
+    if logger.handlers:
+        return
+    handler = logging.FileHandler(destino, encoding='utf-8') if destino else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
@@ -0,0 +1,171 @@
+"""
+Camadas do mapa coroplético de casos por município.
+
+A geometria dos municípios é lida e simplificada uma única vez. Para cada
+indicador, os valores e as cores de cada município são calculados de
+antemão. No mapa, a geometria fica no mapa base (`geometria_mapa`) e é
+desenhada uma vez; trocar o indicador só envia e aplica os valores e as
+cores (`ValoresCamada`) à camada já desenhada.
+Os municípios da tabela são ligados às features pelo GEOCODIGO (ver regioes.py).
+"""
+import json
+
+import numpy as np
+from branca.element import MacroElement
+from jinja2 import Template
+
+
+# Cores do mapa: (limite superior de casos, cor)
+FAIXAS_CORES = [(0, '#ffeda0'), (5, '#feb24c'), (20, '#fc4e2a')]
+COR_MAXIMA = '#b10026'
+
+# Tolerância da simplificação, em graus (cerca de 50 m), adequada ao zoom da regional
+TOLERANCIA = 0.0005
+CASAS_DECIMAIS = 5
+
+PROPRIEDADES = ['GEOCODIGO', 'NOME', 'CRS']
+
+# Estilo dos municípios no mapa, além da cor de preenchimento
+ESTILO = {'color': 'black', 'weight': 0.5, 'fillOpacity': 0.7}
+
+
+def _simplificar_anel(pontos, tolerancia):
+    """Douglas-Peucker sobre um anel de coordenadas (array n x 2)."""
+    if len(pontos) <= 4:
+        return pontos
+    manter = np.zeros(len(pontos), dtype=bool)
+    manter[0] = manter[-1] = True
+    pilha = [(0, len(pontos) - 1)]
+    while pilha:
+        inicio, fim = pilha.pop()
+        if fim - inicio < 2:
+            continue
+        a, b = pontos[inicio], pontos[fim]
+        meio = pontos[inicio + 1:fim]
+        direcao = b - a
+        comprimento = np.hypot(*direcao)
+        if comprimento == 0:
+            distancias = np.hypot(*(meio - a).T)
+        else:
+            distancias = np.abs(direcao[0] * (meio[:, 1] - a[1]) - direcao[1] * (meio[:, 0] - a[0])) / comprimento
+        maior = int(np.argmax(distancias))
+        if distancias[maior] > tolerancia:
+            indice = inicio + 1 + maior
+            manter[indice] = True
+            pilha.append((inicio, indice))
+            pilha.append((indice, fim))
+    simplificado = pontos[manter]
+    # Um anel precisa de pelo menos 4 pontos (o primeiro repetido no fim)
+    return simplificado if len(simplificado) >= 4 else pontos
+
+
+def carregar_geometria(caminho, tolerancia=TOLERANCIA, casas_decimais=CASAS_DECIMAIS):
+    """Lê o GeoJSON dos municípios com os polígonos simplificados e só as propriedades usadas."""
+    with open(caminho, 'r', encoding='utf-8') as f:
+        geojson_data = json.load(f)
+
+    features = []
+    for feature in geojson_data['features']:
+        geometria = feature['geometry']
+        poligonos = geometria['coordinates'] if geometria['type'] == 'MultiPolygon' else [geometria['coordinates']]
+        coordenadas = [
+            [np.round(_simplificar_anel(np.asarray(anel, dtype=float), tolerancia), casas_decimais).tolist()
+             for anel in poligono]
+            for poligono in poligonos
+        ]
+        features.append({
+            'type': 'Feature',
+            'properties': {chave: feature['properties'].get(chave) for chave in PROPRIEDADES},
+            'geometry': {'type': 'MultiPolygon', 'coordinates': coordenadas},
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def geometria_regional(geometria, crs):
+    """Só as features dos municípios da regional `crs`."""
+    features = [feature for feature in geometria['features']
+                if feature['properties']['CRS'] is not None and int(feature['properties']['CRS']) == int(crs)]
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def centro(geometria):
+    """[latitude, longitude] do centro do retângulo que envolve a geometria."""
+    pontos = np.concatenate([np.asarray(anel).reshape(-1, 2) for feature in geometria['features']
+                             for poligono in feature['geometry']['coordinates'] for anel in poligono])
+    minimo, maximo = pontos.min(axis=0), pontos.max(axis=0)
+    return [float((minimo[1] + maximo[1]) / 2), float((minimo[0] + maximo[0]) / 2)]
+
+
+def cores(casos):
+    """Cor de cada município conforme o número de casos."""
+    casos = np.asarray(casos)
+    return np.select([casos <= limite for limite, _ in FAIXAS_CORES],
+                     [cor for _, cor in FAIXAS_CORES], COR_MAXIMA).tolist()
+
+
+def preparar_camadas(tabela_completa, geometria, indicadores, geocodigos):
+    """Calcula, para cada indicador, os casos e as cores na ordem das features da geometria.
+
+    `geocodigos` leva o nome do município no SIVEP ao GEOCODIGO da feature.
+    """
+    codigos = tabela_completa['Município'].str.upper().map(geocodigos)
+    ordem = [str(feature['properties']['GEOCODIGO']) for feature in geometria['features']]
+
+    camadas = {}
+    for indicador in indicadores:
+        casos = tabela_completa[indicador].groupby(codigos.to_numpy()).sum().reindex(ordem, fill_value=0)
+        casos = casos.to_numpy().astype(int)
+        camadas[indicador] = {'casos': casos.tolist(), 'cores': cores(casos)}
+    return camadas
+
+
+def geometria_mapa(geometria):
+    """GeoJSON do mapa base: a geometria com casos zerados, até que `ValoresCamada` aplique um indicador."""
+    cor = cores([0])[0]
+    features = [{**feature, 'properties': {**feature['properties'], 'casos': 0, 'cor': cor}}
+                for feature in geometria['features']]
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+class CamadaMunicipios(MacroElement):
+    """Filho do GeoJson do mapa base; registra a camada no navegador para `ValoresCamada`."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        window.camada_municipios = {{ this._parent.get_name() }};
+        {% endmacro %}
+    """)
+
+
+class ValoresCamada(MacroElement):
+    """Aplica os casos e as cores de uma camada à camada dos municípios já desenhada.
+
+    Só os valores vão para o navegador, por município (GEOCODIGO); o estilo
+    da camada passa a usar a nova cor, inclusive ao desfazer o destaque.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var camada = window.camada_municipios;
+            var valores = {{ this.valores|tojson }};
+            var estilo = {{ this.estilo|tojson }};
+            camada.options.style = function (feature) {
+                return Object.assign({fillColor: feature.properties.cor}, estilo);
+            };
+            camada.eachLayer(function (layer) {
+                var valor = valores[layer.feature.properties.GEOCODIGO];
+                layer.feature.properties.casos = valor[0];
+                layer.feature.properties.cor = valor[1];
+                camada.resetStyle(layer);
+            });
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, geometria, camada):
+        super().__init__()
+        self._name = 'ValoresCamada'
+        self.valores = {str(feature['properties']['GEOCODIGO']): [casos, cor]
+                        for feature, casos, cor in zip(geometria['features'], camada['casos'], camada['cores'])}
+        self.estilo = ESTILO
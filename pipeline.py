@@ -0,0 +1,286 @@
+"""
+Processamento completo de uma carga do SIVEP-Gripe, sem depender do Streamlit.
+
+Lê os arquivos ZIP/DBF de uma regional, decodifica e agrega as notificações
+e monta as tabelas do painel. O painel usa as mesmas funções. Pela linha de
+comando, o resultado é gravado em um diretório, de onde o painel pode
+carregá-lo ao abrir, sem reprocessar os arquivos:
+
+    python pipeline.py dados/ resultados/ --csv
+
+Várias regionais são processadas com uma única leitura dos arquivos, que
+são divididos pela regional de residência:
+
+    python pipeline.py dados/ resultados/ --todas-regioes
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import cached_property
+
+import pandas as pd
+
+from armazem import ArmazemColunar
+from exportacao import exportar
+from filtros import IndiceCategorias
+from incremental import CargaIncremental
+from instrumentacao import Medicoes, configurar_log, etapa
+from ingestao import COLUNAS_SIVEP, REGIAO_PADRAO, MontadorTabela, ler_dbfs_regioes, ler_zips_regioes
+from processamento import montar_tabelas
+from regioes import GEOJSON_PADRAO, ler_regionais
+
+
+EXTENSOES = ('.zip', '.dbf')
+
+# Tabelas gravadas para uso externo; a matriz e o cubo são gravados para o painel
+SAIDAS = ['pacientes_uti', 'tabela_completa', 'obitos', 'dados_detalhados']
+
+MANIFESTO = 'resultado.json'
+
+# Gerações anteriores mantidas, para quem ainda esteja lendo a que acabou de ser substituída
+GERACOES_MANTIDAS = 1
+TENTATIVAS_LEITURA = 3
+
+
+def listar_arquivos(diretorio):
+    """Caminhos dos arquivos ZIP e DBF do diretório, em ordem de nome."""
+    return sorted(os.path.join(diretorio, nome) for nome in os.listdir(diretorio) if nome.lower().endswith(EXTENSOES))
+
+
+def ler_arquivos_regioes(caminhos, regioes, armazem=None, executor=None, medicoes=None):
+    """Lê ZIPs e DBFs soltos uma única vez e devolve {regional: {nome do DBF: DataFrame}}."""
+    zips = []
+    dbfs = []
+    for caminho in caminhos:
+        if caminho.lower().endswith('.zip'):
+            with open(caminho, 'rb') as f:
+                zips.append(f.read())
+        else:
+            dbfs.append(caminho)
+
+    partes = dict(zip(map(os.path.basename, dbfs), ler_dbfs_regioes(dbfs, regioes, COLUNAS_SIVEP, armazem=armazem,
+                                                                    executor=executor, medicoes=medicoes)))
+    arquivos_dbf = {regiao: {nome: por_regiao[regiao] for nome, por_regiao in partes.items()} for regiao in regioes}
+    for por_regiao in ler_zips_regioes(zips, regioes, COLUNAS_SIVEP, armazem=armazem, executor=executor,
+                                       medicoes=medicoes):
+        for regiao, arquivos_zip in por_regiao.items():
+            arquivos_dbf[regiao].update(arquivos_zip)
+    return arquivos_dbf
+
+
+def ler_arquivos(caminhos, regiao=REGIAO_PADRAO, armazem=None, executor=None, medicoes=None):
+    """Lê ZIPs e DBFs soltos e devolve {nome do DBF: DataFrame}."""
+    return ler_arquivos_regioes(caminhos, [regiao], armazem, executor, medicoes)[regiao]
+
+
+def consolidar(arquivos_dbf, regiao=REGIAO_PADRAO):
+    """Junta os DBFs em ordem de nome e devolve (pacientes com COVID-19 em UTI, dados_geral)."""
+    montador = MontadorTabela()
+    for arquivo_dbf in sorted(arquivos_dbf):
+        montador.adicionar(arquivos_dbf[arquivo_dbf])
+    dados_geral = montador.montar()
+
+    # Filtros específicos
+    dados_2020_2021_2022 = dados_geral[(dados_geral['CLASSI_FIN']=='5')&
+                                       (dados_geral['ID_RG_RESI']==regiao)&
+                                       (dados_geral['UTI']=='1')&
+                                       (dados_geral['DT_SAIDUTI']=='')]
+
+    dados_2020_2021_2022 = dados_2020_2021_2022.filter(['NM_PACIENT', 'ID_MN_RESI','DT_NOTIFIC'])
+    dados_2020_2021_2022.columns = ['nome do paciente', 'municipio de residencia', 'data da notificacao']
+
+    return dados_2020_2021_2022, dados_geral
+
+
+class Resultado:
+    """Tabelas de uma carga processada.
+
+    `carga` (CargaIncremental) permite atualizar o resultado com uma nova
+    carga; é None quando o resultado foi lido do disco. `municipios` são os
+    municípios da regional, que aparecem nas tabelas mesmo sem casos.
+    """
+
+    def __init__(self, regiao, pacientes_uti, dados_consolidados2, matriz, cubo, versao, carga=None,
+                 gerado_em=None, municipios=()):
+        self.regiao = regiao
+        self.pacientes_uti = pacientes_uti
+        self.dados_consolidados2 = dados_consolidados2
+        self.matriz = matriz
+        self.cubo = cubo
+        self.versao = versao
+        self.carga = carga
+        self.gerado_em = gerado_em
+        self.municipios = municipios
+
+    @cached_property
+    def tabelas(self):
+        """(consolidado, tabela_virus, tabela_completa, obitos)"""
+        return montar_tabelas(self.matriz, self.municipios)
+
+    @cached_property
+    def indice(self):
+        """Índice de filtros da tabela detalhada, construído na primeira consulta."""
+        return IndiceCategorias(self.dados_consolidados2)
+
+    def memoria(self):
+        """Bytes estimados das tabelas do resultado e da carga."""
+        tabelas = [self.pacientes_uti, self.dados_consolidados2, self.matriz, self.cubo]
+        total = 0
+        if self.carga is not None:
+            tabelas.append(self.carga.dados_geral)
+            total += self.carga.chaves.nbytes + self.carga.assinaturas.nbytes
+        return int(total + sum(tabela.memory_usage(deep=True).sum() for tabela in tabelas))
+
+    def saidas(self):
+        _, _, tabela_completa, obitos = self.tabelas
+        return {'pacientes_uti': self.pacientes_uti, 'tabela_completa': tabela_completa, 'obitos': obitos,
+                'dados_detalhados': self.dados_consolidados2}
+
+
+def processar(arquivos_dbf, regiao=REGIAO_PADRAO, anterior=None, medicoes=None, municipios=()):
+    """Processa os DBFs lidos e devolve (resultado, resumo da atualização ou None).
+
+    Com um resultado `anterior` da mesma regional que tenha a carga, só as
+    notificações novas, alteradas ou removidas são reprocessadas.
+    """
+    with etapa(medicoes, 'consolidacao', sum(len(dados) for dados in arquivos_dbf.values())) as registro:
+        pacientes_uti, dados_geral = consolidar(arquivos_dbf, regiao)
+        registro['linhas_saida'] = len(dados_geral)
+    if (anterior is not None and anterior.carga is not None and anterior.regiao == regiao
+            and CargaIncremental.suporta(dados_geral)):
+        carga, resumo = anterior.carga.atualizar(dados_geral, medicoes)
+        if carga is anterior.carga:
+            return anterior, resumo
+    else:
+        carga, resumo = CargaIncremental.completa(dados_geral, medicoes, regiao, municipios), None
+    resultado = Resultado(regiao, pacientes_uti, carga.dados_consolidados2, carga.matriz, carga.cubo, carga.versao,
+                          carga, municipios=carga.municipios)
+    return resultado, resumo
+
+
+def _diretorio_regiao(diretorio, regiao):
+    return os.path.join(diretorio, regiao.replace(' ', '_'))
+
+
+def _gravar_atomico(caminho, gravar, modo='wb'):
+    temporario = caminho + '.%d.tmp' % os.getpid()
+    with open(temporario, modo, **({} if 'b' in modo else {'encoding': 'utf-8'})) as f:
+        gravar(f)
+    os.replace(temporario, caminho)
+
+
+def gravar_resultado(resultado, diretorio, csv=False):
+    """Grava as tabelas do resultado em Parquet (e, com `csv`, as saídas também em CSV).
+
+    As tabelas Parquet de cada gravação vão para um subdiretório novo (uma
+    geração) e o manifesto, trocado de forma atômica no fim, aponta para ela:
+    quem leu o manifesto anterior continua lendo tabelas da mesma geração. Um
+    resultado só é lido se tiver manifesto. Os CSVs, para uso externo, ficam
+    sempre no diretório da regional, cada um trocado de forma atômica.
+    """
+    destino = _diretorio_regiao(diretorio, resultado.regiao)
+    geracao = 'geracao=' + datetime.now().strftime('%Y%m%dT%H%M%S%f') + '_%d' % os.getpid()
+    os.makedirs(os.path.join(destino, geracao))
+
+    saidas = resultado.saidas()
+    for nome, tabela in {**saidas, 'matriz': resultado.matriz, 'cubo': resultado.cubo}.items():
+        tabela.to_parquet(os.path.join(destino, geracao, nome + '.parquet'))
+    if csv:
+        for nome in SAIDAS:
+            # Índices com nome (os municípios, em obitos) viram a primeira coluna do CSV
+            tabela = saidas[nome] if saidas[nome].index.name is None else saidas[nome].reset_index()
+            _gravar_atomico(os.path.join(destino, nome + '.csv'), lambda f: exportar(tabela, f, 'CSV'))
+
+    manifesto = {'regiao': resultado.regiao, 'versao': resultado.versao, 'geracao': geracao,
+                 'gerado_em': datetime.now().isoformat(timespec='seconds'),
+                 'registros': len(resultado.dados_consolidados2), 'municipios': list(resultado.municipios)}
+    _gravar_atomico(os.path.join(destino, MANIFESTO),
+                    lambda f: json.dump(manifesto, f, ensure_ascii=False, indent=1), 'w')
+
+    anteriores = sorted(nome for nome in os.listdir(destino) if nome.startswith('geracao=') and nome != geracao)
+    for nome in anteriores[:len(anteriores) - GERACOES_MANTIDAS]:
+        shutil.rmtree(os.path.join(destino, nome), ignore_errors=True)
+    return destino
+
+
+def ler_manifesto(diretorio, regiao=REGIAO_PADRAO):
+    """Manifesto do resultado gravado para a regional, ou None se não houver."""
+    try:
+        with open(os.path.join(_diretorio_regiao(diretorio, regiao), MANIFESTO), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def carregar_resultado(diretorio, regiao=REGIAO_PADRAO):
+    """Lê um resultado gravado por `gravar_resultado`, ou devolve None se não houver."""
+    for tentativa in range(TENTATIVAS_LEITURA):
+        manifesto = ler_manifesto(diretorio, regiao)
+        if manifesto is None:
+            return None
+        origem = os.path.join(_diretorio_regiao(diretorio, regiao), manifesto['geracao'])
+        try:
+            tabelas = {nome: pd.read_parquet(os.path.join(origem, nome + '.parquet'))
+                       for nome in ['pacientes_uti', 'dados_detalhados', 'matriz', 'cubo']}
+            break
+        except FileNotFoundError:
+            # A geração foi descartada durante a leitura, por duas gravações seguidas: relê o manifesto
+            if tentativa == TENTATIVAS_LEITURA - 1:
+                raise
+    return Resultado(regiao, tabelas['pacientes_uti'], tabelas['dados_detalhados'], tabelas['matriz'],
+                     tabelas['cubo'], manifesto['versao'], gerado_em=manifesto['gerado_em'],
+                     municipios=manifesto.get('municipios', []))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Processa os arquivos do SIVEP-Gripe de uma ou mais regionais e grava as tabelas do painel.')
+    parser.add_argument('entrada', help='diretório com os arquivos ZIP ou DBF')
+    parser.add_argument('saida', help='diretório onde gravar os resultados (um subdiretório por regional)')
+    parser.add_argument('--regiao', action='append',
+                        help=f'regional de residência (ID_RG_RESI); pode ser repetida (padrão: {REGIAO_PADRAO})')
+    parser.add_argument('--todas-regioes', action='store_true', help='processa todas as regionais do GeoJSON')
+    parser.add_argument('--geojson', default=GEOJSON_PADRAO,
+                        help='GeoJSON dos municípios, com as propriedades CRS, NOME e GEOCODIGO')
+    parser.add_argument('--csv', action='store_true', help='grava as tabelas também em CSV')
+    parser.add_argument('--armazem', help='diretório do armazém Parquet, para reaproveitar DBFs já convertidos')
+    parser.add_argument('--processos', type=int, default=os.cpu_count() or 1,
+                        help='processos para decodificar os DBFs em paralelo')
+    parser.add_argument('--log-desempenho', nargs='?', const='', metavar='ARQUIVO',
+                        help='registra tempo e memória de cada etapa (JSON por linha) no arquivo, ou em stderr')
+    args = parser.parse_args(argv)
+
+    regionais = ler_regionais(args.geojson)
+    regioes = list(regionais) if args.todas_regioes else list(dict.fromkeys(args.regiao or [REGIAO_PADRAO]))
+
+    medicoes = None
+    if args.log_desempenho is not None:
+        configurar_log(args.log_desempenho or None)
+        medicoes = Medicoes({'regioes': regioes, 'origem': 'pipeline'})
+
+    if not os.path.isdir(args.entrada):
+        parser.error(f'diretório não encontrado: {args.entrada}')
+    caminhos = listar_arquivos(args.entrada)
+    if not caminhos:
+        parser.error(f'nenhum arquivo ZIP ou DBF em {args.entrada}')
+
+    armazem = ArmazemColunar(args.armazem) if args.armazem else None
+    with ProcessPoolExecutor(max_workers=args.processos, mp_context=multiprocessing.get_context('spawn')) as executor:
+        por_regiao = ler_arquivos_regioes(caminhos, regioes, armazem, executor, medicoes)
+
+    for regiao in regioes:
+        if medicoes is not None:
+            medicoes.contexto['regiao'] = regiao
+        municipios = regionais[regiao].municipios if regiao in regionais else ()
+        resultado, _ = processar(por_regiao.pop(regiao), regiao, medicoes=medicoes, municipios=municipios)
+        with etapa(medicoes, 'gravacao', len(resultado.dados_consolidados2)):
+            destino = gravar_resultado(resultado, args.saida, csv=args.csv)
+        print(f'{len(resultado.dados_consolidados2)} notificações de {regiao} processadas; resultados em {destino}')
+
+
+if __name__ == '__main__':
+    main()
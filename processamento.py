@@ -0,0 +1,245 @@
+"""
+Transformações e agregações dos dados de SRAG da regional.
+
+As agregações por município ficam numa única matriz de contagens, da qual
+saem todas as tabelas do painel. As contagens são aditivas: a matriz de um
+conjunto de notificações é a soma das matrizes das suas partes. Assim uma
+atualização pode subtrair as notificações que saíram e somar as que
+entraram, sem recalcular tudo (ver incremental.py).
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from datas import converter_datas, semana_epidemiologica, semanas_entre
+from dicionario import CLASSI_FIN, COLUNAS_DETALHE, INDICADORES, INDICADORES_NORMALIZADOS
+
+
+VIRUS_COLS = INDICADORES_NORMALIZADOS
+
+COLS_CONTAGEM = list(INDICADORES)
+
+COLUNAS_DATA = ['data de notificacao', 'inicio dos sintomas', 'Data de saída da UTI']
+
+MEDIDAS_CUBO = ['casos', 'uti', 'obitos']
+
+
+def decodificar_coluna(serie, traducao=None):
+    """Traduz os códigos de uma coluna para uma Series categórica.
+
+    Os valores distintos são traduzidos uma única vez e os códigos das
+    linhas são remapeados por uma tabela de consulta do NumPy. As categorias
+    seguem a ordem do dicionário, seguidas dos valores não traduzidos.
+    """
+    traducao = traducao or {}
+    codigos, valores = pd.factorize(serie)
+    rotulos = [traducao.get(valor, valor) for valor in valores]
+    declarados = list(dict.fromkeys(traducao.values()))
+    categorias = declarados + sorted(set(rotulos) - set(declarados))
+
+    posicao = {rotulo: indice for indice, rotulo in enumerate(categorias)}
+    tabela = np.array([posicao[rotulo] for rotulo in rotulos] + [-1], dtype='int32')
+    # codigos == -1 (valores ausentes) apontam para o último item da tabela
+    return pd.Series(pd.Categorical.from_codes(tabela[codigos], categorias), index=serie.index)
+
+
+def decodificar(dados_geral, regiao=None):
+    """Traduz os códigos do SIVEP e monta a tabela detalhada (dados_consolidados2).
+
+    Com `regiao`, só as notificações dessa regional de residência entram na tabela.
+    """
+    dados_consolidados3 = dados_geral if regiao is None else dados_geral[(dados_geral['ID_RG_RESI']==regiao)]
+
+    colunas = {}
+    for campo, nome, traducao in COLUNAS_DETALHE:
+        if traducao is None:
+            colunas[nome] = dados_consolidados3[campo]
+        else:
+            colunas[nome] = decodificar_coluna(dados_consolidados3[campo], traducao)
+    dados_consolidados2 = pd.DataFrame(colunas, index=dados_consolidados3.index)
+
+    # Datas convertidas uma única vez para datetime64
+    for coluna in COLUNAS_DATA:
+        dados_consolidados2[coluna] = converter_datas(dados_consolidados2[coluna])
+
+    # Ordenação estável: notificações da mesma data ficam na ordem de leitura
+    return dados_consolidados2.sort_values(by='data de notificacao', kind='stable')
+
+
+def concatenar(partes):
+    """Concatena tabelas detalhadas mantendo as colunas categóricas.
+
+    Partes vazias ficam de fora, exceto se todas forem vazias: o tipo de uma
+    coluna vazia não deve decidir o tipo do resultado.
+    """
+    partes = [parte for parte in partes if len(parte)] or partes[:1]
+    dados = pd.concat(partes)
+    for coluna in partes[0].columns:
+        if isinstance(partes[0][coluna].dtype, pd.CategoricalDtype):
+            dados[coluna] = union_categoricals([parte[coluna] for parte in partes])
+    return dados
+
+
+def _mascara(serie, valores, normalizar=False):
+    # O teste é feito uma vez por categoria e espalhado para as linhas pelos códigos
+    if not isinstance(serie.dtype, pd.CategoricalDtype):
+        serie = serie.astype('category')
+    categorias = serie.cat.categories.to_series().astype(str)
+    if normalizar:
+        categorias = categorias.str.strip().str.lower()
+    por_categoria = np.append(categorias.isin(valores).to_numpy(), False)
+    return por_categoria[serie.cat.codes.to_numpy()]
+
+
+def indicadores_virus(dados_consolidados2):
+    """Devolve um DataFrame com uma coluna 0/1 para cada tipo de vírus."""
+    return pd.DataFrame({
+        indicador: _mascara(dados_consolidados2[coluna], valores, indicador in INDICADORES_NORMALIZADOS).astype('int8')
+        for indicador, (coluna, valores) in INDICADORES.items()
+    }, index=dados_consolidados2.index)
+
+
+def _codigos(serie, fixos):
+    """Códigos das linhas numa lista que começa pelos valores `fixos`, seguidos dos demais em ordem."""
+    codigos, valores = pd.factorize(serie.astype(str) if not isinstance(serie.dtype, pd.CategoricalDtype)
+                                    else serie.cat.remove_unused_categories().astype(str))
+    extras = sorted(set(valores) - set(fixos))
+    rotulos = list(fixos) + extras
+    posicao = {rotulo: indice for indice, rotulo in enumerate(rotulos)}
+    tabela = np.array([posicao[valor] for valor in valores] + [-1], dtype='int64')
+    return tabela[codigos], rotulos
+
+
+def _ordenar(matriz, municipios):
+    # Municípios e classificações fora das listas fixas só aparecem quando têm contagens
+    linhas = matriz[('casos', 'linhas')]
+    matriz = matriz[matriz.index.isin(municipios) | (linhas != 0)]
+    extras_linhas = sorted(set(matriz.index) - set(municipios))
+
+    classificacoes = list(dict.fromkeys(CLASSI_FIN.values()))
+    obitos = [coluna for grupo, coluna in matriz.columns if grupo == 'obitos']
+    extras_colunas = sorted(coluna for coluna in set(obitos) - set(classificacoes)
+                            if matriz[('obitos', coluna)].any())
+    colunas = [('casos', coluna) for coluna in ['linhas'] + COLS_CONTAGEM] + \
+              [('obitos', coluna) for coluna in classificacoes + extras_colunas]
+
+    matriz = matriz.reindex(index=list(municipios) + extras_linhas, columns=pd.MultiIndex.from_tuples(colunas),
+                            fill_value=0)
+    matriz.index.name = 'municipio de residencia'
+    matriz.columns.names = ['grupo', 'indicador']
+    return matriz.astype('int64')
+
+
+def agregar(dados_consolidados2, municipios=()):
+    """Matriz densa município × indicador, calculada numa única passagem pelos casos.
+
+    As linhas são os `municipios` da regional (mais os municípios de
+    residência fora da lista que tiverem casos). As colunas formam dois grupos:
+    'casos' (total de notificações e um indicador por vírus) e 'obitos'
+    (óbitos por classificação final).
+    """
+    codigos_municipio, rotulos_municipio = _codigos(dados_consolidados2['municipio de residencia'], municipios)
+    codigos_classificacao, rotulos_classificacao = _codigos(dados_consolidados2['Classificação final'],
+                                                            list(dict.fromkeys(CLASSI_FIN.values())))
+    morte = (dados_consolidados2['Evolução'] == 'Óbito').to_numpy()
+
+    colunas = {('casos', 'linhas'): np.ones(len(dados_consolidados2), dtype='int8')}
+    for indicador, valores in indicadores_virus(dados_consolidados2).items():
+        colunas[('casos', indicador)] = valores.to_numpy()
+    for indice, classificacao in enumerate(rotulos_classificacao):
+        colunas[('obitos', classificacao)] = (morte & (codigos_classificacao == indice)).astype('int8')
+
+    somas = pd.DataFrame(colunas).groupby(codigos_municipio).sum()
+    matriz = somas.reindex(range(len(rotulos_municipio)), fill_value=0)
+    matriz.index = rotulos_municipio
+    return _ordenar(matriz, municipios)
+
+
+def combinar(matriz, outra, sinal=1, municipios=()):
+    """Soma (ou subtrai, com sinal=-1) duas matrizes de agregados.
+
+    O resultado é igual à matriz calculada do zero sobre a união (ou a
+    diferença) das notificações.
+    """
+    return _ordenar(matriz.add(sinal * outra, fill_value=0), municipios)
+
+
+def montar_tabelas(matriz, municipios=()):
+    """Monta consolidado, tabela_virus, tabela_completa e obitos a partir da matriz de agregados."""
+    casos = matriz['casos'].copy()
+    casos.columns.name = None
+    casos['TOTAL_VIRUS'] = casos[['COVID',
+                    'INFLUENZA_A',
+                    'INFLUENZA_B',
+                    ] + VIRUS_COLS].sum(axis=1)
+
+    # Casos de Covid-19 por município
+    consolidado = casos.loc[casos['COVID'] > 0, 'COVID'].sort_index().reset_index()
+    consolidado.columns = ['municipio de residencia', 'total']
+
+    # Municípios com notificações
+    tabela_virus = casos.loc[casos['linhas'] > 0, COLS_CONTAGEM + ['TOTAL_VIRUS']].sort_index()
+    tabela_virus = tabela_virus.reset_index().rename(columns={'municipio de residencia': 'Município'})
+
+    # Todos os municípios da regional (sem a lista, os que têm notificações), ordenados por nome
+    tabela_completa = casos.loc[list(municipios) or casos.index, COLS_CONTAGEM + ['TOTAL_VIRUS']].sort_index()
+    tabela_completa = tabela_completa.reset_index().rename(columns={'municipio de residencia': 'Município'})
+
+    # Óbitos por classificação final, só municípios e classificações com óbitos
+    obitos = matriz['obitos']
+    obitos = obitos.loc[obitos.sum(axis=1) > 0, obitos.sum(axis=0) > 0].sort_index().sort_index(axis=1)
+    obitos.columns.name = 'Classificação final'
+
+    return consolidado, tabela_virus, tabela_completa, obitos
+
+
+def cubo_semanal(dados_consolidados2):
+    """Cubo semana epidemiológica × município × classificação final.
+
+    As medidas são o número de casos, de internações em UTI e de óbitos. A
+    semana é a do início dos sintomas (ou a da notificação, quando o início
+    não foi informado), no formato AAAASS. Só combinações com casos entram no
+    cubo, que é aditivo como a matriz de agregados.
+    """
+    datas = dados_consolidados2['inicio dos sintomas'].fillna(dados_consolidados2['data de notificacao'])
+    ano, semana = semana_epidemiologica(datas)
+    valido = datas.notna().to_numpy()
+
+    linhas = pd.DataFrame({
+        'semana': (ano * 100 + semana)[valido].astype('int64'),
+        'municipio': dados_consolidados2['municipio de residencia'].astype(str)[valido],
+        'classificacao': dados_consolidados2['Classificação final'].astype(str)[valido],
+        'casos': 1,
+        'uti': (dados_consolidados2['Foi para UTI?'] == 'Sim').to_numpy()[valido].astype('int64'),
+        'obitos': (dados_consolidados2['Evolução'] == 'Óbito').to_numpy()[valido].astype('int64'),
+    })
+    return linhas.groupby(['semana', 'municipio', 'classificacao']).sum().astype('int64')
+
+
+def combinar_cubos(cubo, outro, sinal=1):
+    """Soma (ou subtrai, com sinal=-1) dois cubos semanais."""
+    cubo = cubo.add(sinal * outro, fill_value=0).astype('int64')
+    return cubo[cubo['casos'] != 0].sort_index()
+
+
+def fatiar_cubo(cubo, medida, municipios=None, classificacoes=None):
+    """Série semanal de uma medida, com uma coluna por classificação final.
+
+    O custo depende do tamanho do cubo, não do número de notificações.
+    Semanas sem casos no intervalo aparecem com zero.
+    """
+    selecao = cubo[medida]
+    if municipios:
+        selecao = selecao[selecao.index.get_level_values('municipio').isin(municipios)]
+    if classificacoes:
+        selecao = selecao[selecao.index.get_level_values('classificacao').isin(classificacoes)]
+
+    serie = selecao.groupby(level=['semana', 'classificacao']).sum().unstack(fill_value=0)
+    if serie.empty:
+        return serie
+    semanas = semanas_entre(int(serie.index.min()), int(serie.index.max()))
+    serie = serie.reindex(semanas, fill_value=0)
+    serie.index = ['%d/%02d' % divmod(codigo, 100) for codigo in serie.index]
+    serie.index.name = 'semana epidemiológica'
+    serie.columns.name = None
+    return serie
@@ -0,0 +1,69 @@
+"""
+Regionais de saúde (CRS) e seus municípios, a partir do GeoJSON dos municípios.
+
+Cada feature do GeoJSON traz o número da regional (CRS), o nome do
+município com acentos (NOME) e o código do IBGE (GEOCODIGO). No SIVEP a
+regional de residência vem como '014 CRS' e o município em maiúsculas, sem
+acentos; a lista de municípios de cada regional e o mapeamento de nomes do
+SIVEP para o GeoJSON são derivados dessas propriedades.
+"""
+import json
+import os
+import unicodedata
+
+
+GEOJSON_PADRAO = os.environ.get('SRAG_GEOJSON',
+                                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'municipios_14.geojson'))
+
+
+def codigo_regiao(crs):
+    """Código da regional no SIVEP (ID_RG_RESI): 14 -> '014 CRS'."""
+    return '%03d CRS' % int(crs)
+
+
+def nome_sivep(nome):
+    """Nome do município como no SIVEP: maiúsculas, sem acentos."""
+    decomposto = unicodedata.normalize('NFKD', nome)
+    return ''.join(caractere for caractere in decomposto if not unicodedata.combining(caractere)).upper().strip()
+
+
+class Regional:
+    """Uma regional de saúde e seus municípios.
+
+    `municipios` são os nomes do SIVEP, em ordem alfabética; `nomes` e
+    `geocodigos` levam cada um deles ao NOME e ao GEOCODIGO do GeoJSON.
+    """
+
+    def __init__(self, crs, nome=None):
+        self.crs = int(crs)
+        self.codigo = codigo_regiao(crs)
+        self.nome = nome
+        self.nomes = {}
+        self.geocodigos = {}
+
+    @property
+    def municipios(self):
+        return sorted(self.nomes)
+
+    @property
+    def rotulo(self):
+        return 'CRS %03d' % self.crs
+
+
+def ler_regionais(caminho=GEOJSON_PADRAO):
+    """Lê as propriedades das features e devolve {código no SIVEP: Regional}, em ordem de código."""
+    with open(caminho, 'r', encoding='utf-8') as f:
+        geojson_data = json.load(f)
+
+    regionais = {}
+    for feature in geojson_data['features']:
+        propriedades = feature['properties']
+        if propriedades.get('CRS') is None:
+            continue
+        codigo = codigo_regiao(propriedades['CRS'])
+        if codigo not in regionais:
+            regionais[codigo] = Regional(propriedades['CRS'], propriedades.get('NOMEREGIAO'))
+        municipio = nome_sivep(propriedades['NOME'])
+        regionais[codigo].nomes[municipio] = propriedades['NOME']
+        regionais[codigo].geocodigos[municipio] = str(propriedades['GEOCODIGO'])
+    return dict(sorted(regionais.items()))
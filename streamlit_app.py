@@ -1,246 +1,307 @@
 import streamlit as st
-from dbfread import DBF
 import pandas as pd
 import os
-import zipfile
-from io import BytesIO
+import multiprocessing
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
 import folium
 from streamlit_folium import st_folium
-import json
 
+from armazem import ArmazemColunar
+from cache import CacheArquivos, hash_conteudo
+from compartilhado import RepositorioCompartilhado
+from exportacao import FORMATOS, CacheExportacoes, chave_exportacao
+from filtros import paginar
+from ingestao import COLUNAS_SIVEP, REGIAO_PADRAO, ler_zips_regioes
+from instrumentacao import Medicoes, configurar_log, etapa
+from mapa import (ESTILO, CamadaMunicipios, ValoresCamada, carregar_geometria, centro, geometria_mapa,
+                  geometria_regional, preparar_camadas)
+from pipeline import carregar_resultado, ler_manifesto, processar
+from processamento import COLUNAS_DATA, fatiar_cubo
+from regioes import GEOJSON_PADRAO, ler_regionais
+
+
+# As tabelas processadas são compartilhadas entre as sessões; com cópia na escrita, o que uma
+# sessão deriva delas são visões, e uma alteração nunca chega à cópia compartilhada
+pd.set_option('mode.copy_on_write', True)
 
 # Configuração da página
-st.set_page_config(page_title="Análise de SRAG - CRS 014", layout="wide")
+st.set_page_config(page_title="Análise de SRAG", layout="wide")
+
+# Cache dos arquivos processados e armazém Parquet, compartilhados entre as sessões
+DIRETORIO_DADOS = os.environ.get('SRAG_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+
+# Resultados pré-processados pela linha de comando (pipeline.py)
+DIRETORIO_RESULTADOS = os.environ.get('SRAG_RESULTADOS', os.path.join(DIRETORIO_DADOS, 'resultados'))
+
+
+@st.cache_resource
+def obter_cache():
+    return CacheArquivos(os.path.join(DIRETORIO_DADOS, 'uploads'))
+
+
+@st.cache_resource
+def obter_armazem():
+    return ArmazemColunar(os.path.join(DIRETORIO_DADOS, 'armazem'))
+
+
+# Processos para decodificar vários DBFs em paralelo
+@st.cache_resource
+def obter_executor():
+    processos = int(os.environ.get('SRAG_PROCESSOS', os.cpu_count() or 1))
+    return ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context('spawn'))
+
+
+@st.cache_resource
+def obter_exportacoes():
+    return CacheExportacoes(os.path.join(DIRETORIO_DADOS, 'exportacoes'))
+
+
+def botao_download(rotulo, nome, dados, chave, key, posicoes=None):
+    """Formato e botão de download; o arquivo só é gerado quando o botão é clicado."""
+    formato = st.radio('Formato', options=list(FORMATOS), horizontal=True, key=key + '-formato')
+    extensao, mime = FORMATOS[formato]
+    st.download_button(
+        rotulo,
+        lambda: obter_exportacoes().obter(chave_exportacao(*chave, formato), formato, dados, posicoes),
+        f"{nome}.{extensao}",
+        mime,
+        key=key
+    )
+
+
+# Log de desempenho (uma linha JSON por etapa) em SRAG_LOG_DESEMPENHO, ou em stderr
+@st.cache_resource
+def iniciar_log():
+    configurar_log(os.environ.get('SRAG_LOG_DESEMPENHO'))
+
+
+def hash_upload(uploaded_file):
+    """Hash do conteúdo de um arquivo enviado, calculado uma vez por sessão."""
+    hashes = st.session_state.setdefault('hashes_uploads', {})
+    if uploaded_file.file_id not in hashes:
+        hashes[uploaded_file.file_id] = hash_conteudo(uploaded_file.getvalue())
+    return hashes[uploaded_file.file_id]
+
+
+def chave_upload(uploaded_file, regiao):
+    return hash_upload(uploaded_file) + '_' + hash_conteudo(' '.join([regiao] + COLUNAS_SIVEP).encode())[:8]
+
+
+def carregar_zips(uploaded_files, regiao, medicoes=None):
+    cache = obter_cache()
+    with etapa(medicoes, 'cache_uploads') as registro:
+        chaves = [chave_upload(uploaded_file, regiao) for uploaded_file in uploaded_files]
+        resultados = [cache.obter(chave) for chave in chaves]
+        registro['linhas_saida'] = sum(len(dados) for resultado in resultados if resultado is not None
+                                       for dados in resultado.values())
+
+    # Os ZIPs fora do cache são lidos juntos, para aproveitar o paralelismo, e uma única vez
+    # para todas as regionais: as outras ficam no cache, prontas para quem as escolher
+    faltantes = [indice for indice, resultado in enumerate(resultados) if resultado is None]
+    if faltantes:
+        regioes = list(dict.fromkeys([regiao, *obter_regionais()]))
+        conteudos = [uploaded_files[indice].getvalue() for indice in faltantes]
+        executor = obter_executor()
+        try:
+            lidos = ler_zips_regioes(conteudos, regioes, COLUNAS_SIVEP, armazem=obter_armazem(), executor=executor,
+                                     medicoes=medicoes)
+        except BrokenProcessPool:
+            # Um processo morreu (por exemplo, por falta de memória) e o pool não se recupera: ele é
+            # descartado, para que a próxima carga crie outro, e esta é lida sem paralelismo
+            executor.shutdown(wait=False, cancel_futures=True)
+            obter_executor.clear()
+            lidos = ler_zips_regioes(conteudos, regioes, COLUNAS_SIVEP, armazem=obter_armazem(), medicoes=medicoes)
+        for indice, por_regiao in zip(faltantes, lidos):
+            for outra, resultado in por_regiao.items():
+                cache.guardar(chave_upload(uploaded_files[indice], outra), resultado)
+            resultados[indice] = por_regiao[regiao]
+    return resultados
+
+
+def carregar_armazenados(extratos, regiao, medicoes=None):
+    armazem = obter_armazem()
+    with etapa(medicoes, 'leitura_armazem') as registro:
+        arquivos_dbf = {extrato['nome']: armazem.ler(extrato['hash'], regiao, COLUNAS_SIVEP) for extrato in extratos}
+        registro['linhas_saida'] = sum(len(dados) for dados in arquivos_dbf.values())
+    return arquivos_dbf
+
+
+# Resultados processados, uma cópia por servidor para todas as sessões que usam os mesmos dados
+@st.cache_resource
+def obter_repositorio():
+    return RepositorioCompartilhado(int(os.environ.get('SRAG_MEMORIA_COMPARTILHADA_MB', 2048)) * 1024 ** 2)
+
+
+def usar_compartilhado(chave, calcular):
+    """Resultado compartilhado de `chave`, mantido em uso enquanto a sessão o exibir."""
+    atual = st.session_state.get('conjunto_compartilhado')
+    if atual is not None and atual.chave == chave and atual.ativa:
+        return atual.valor
+    referencia = obter_repositorio().adquirir(chave, calcular, tamanho=lambda valor: valor.memoria())
+    liberar_compartilhado()
+    st.session_state['conjunto_compartilhado'] = referencia
+    return referencia.valor
+
+
+def liberar_compartilhado():
+    atual = st.session_state.pop('conjunto_compartilhado', None)
+    if atual is not None:
+        atual.liberar()
+
+
+def processar_carga(uploaded_files, extratos, regiao, incremental, medicoes=None):
+    """Lê e processa os arquivos e devolve (resultado, resumo da atualização ou None).
+
+    Sessões com os mesmos arquivos usam o mesmo resultado; o resumo é só da
+    sessão que fez o processamento.
+    """
+    chave = ('carga', regiao, tuple(map(hash_upload, uploaded_files)), tuple(extrato['hash'] for extrato in extratos))
+    resumos = {}
+
+    def calcular():
+        # Ler os extratos armazenados e os ZIPs (resultado guardado em cache pelo hash do conteúdo)
+        arquivos_dbf = carregar_armazenados(extratos, regiao, medicoes)
+        for arquivos_zip in carregar_zips(uploaded_files, regiao, medicoes):
+            arquivos_dbf.update(arquivos_zip)
+
+        # Decodificar e agregar, aproveitando o resultado anterior desta sessão quando possível
+        anterior = cargas[regiao]() if incremental and regiao in cargas else None
+        resultado, resumos[chave] = processar(arquivos_dbf, regiao, anterior, medicoes,
+                                              obter_regionais()[regiao].municipios)
+        return resultado
+
+    # Último resultado de cada regional nesta sessão, base para a atualização incremental; a
+    # referência é fraca para não impedir que o repositório o descarte
+    cargas = st.session_state.setdefault('cargas_anteriores', {})
+    resultado = usar_compartilhado(chave, calcular)
+    cargas[regiao] = weakref.ref(resultado)
+    if chave in resumos:
+        st.session_state['resumo_atualizacao'] = (chave, resumos[chave])
+    chave_resumo, resumo = st.session_state.get('resumo_atualizacao', (None, None))
+    return resultado, resumo if chave_resumo == chave else None
+
+
+# Regionais e municípios (SRAG_GEOJSON), lidos uma vez por servidor
+@st.cache_resource
+def obter_regionais():
+    return ler_regionais(GEOJSON_PADRAO)
+
+
+# Geometria dos municípios, lida uma vez por servidor e separada por regional
+@st.cache_resource
+def obter_geometria_completa():
+    return carregar_geometria(GEOJSON_PADRAO)
+
+
+@st.cache_resource
+def obter_geometria(regiao):
+    return geometria_regional(obter_geometria_completa(), obter_regionais()[regiao].crs)
+
+
+@st.cache_data(max_entries=32)
+def preparar_camadas_mapa(tabela_completa, indicadores, regiao):
+    return preparar_camadas(tabela_completa, obter_geometria(regiao), indicadores, obter_regionais()[regiao].geocodigos)
+
+
+MEDIDAS_CURVA = {'casos': 'Casos', 'uti': 'Internações em UTI', 'obitos': 'Óbitos'}
+
+FORMATO_DATAS = {coluna: st.column_config.DateColumn(format='DD/MM/YYYY') for coluna in COLUNAS_DATA}
+
+TAMANHOS_PAGINA = [100, 500, 1000, 5000]
+
+INDICADORES_MAPA = ['COVID', 'INFLUENZA_A', 'INFLUENZA_A_H1N1', 'INFLUENZA_A_H3N2', 'INFLUENZA_B',
+                    'INFLUENZA_B_VICTORIA', 'INFLUENZA_B_YAMAGATA', 'TOTAL_VIRUS']
+
+
+# Regional analisada; o parâmetro ?regiao= da URL permite guardar o endereço de cada regional
+regionais = obter_regionais()
+opcoes_regioes = list(regionais)
+regiao_url = st.query_params.get('regiao', REGIAO_PADRAO)
+regiao = st.sidebar.selectbox(
+    "Regional de saúde",
+    options=opcoes_regioes,
+    index=opcoes_regioes.index(regiao_url) if regiao_url in opcoes_regioes else 0,
+    format_func=lambda codigo: ' - '.join(filter(None, [regionais[codigo].rotulo, regionais[codigo].nome])))
+st.query_params['regiao'] = regiao
+regional = regionais[regiao]
 
 # Título do aplicativo
-st.title("Análise de Dados de SRAG - CRS 014")
-st.markdown("""
-Este painel permite analisar dados de SRAG (Síndrome Respiratória Aguda Grave) da região CRS 014.
+st.title(f"Análise de Dados de SRAG - {regional.rotulo}")
+st.markdown(f"""
+Este painel permite analisar dados de SRAG (Síndrome Respiratória Aguda Grave) da região {regional.rotulo}.
 Carregue arquivos ZIP contendo DBFs para iniciar a análise.
 """)
 
 # Upload de arquivos
 uploaded_files = st.sidebar.file_uploader("Carregue arquivos ZIP com dados DBF", type="zip", accept_multiple_files=True)
 
+# Extratos já convertidos em sessões anteriores podem ser usados sem novo upload
+extratos_armazenados = obter_armazem().extratos(regiao)
+extratos_selecionados = st.sidebar.multiselect(
+    "Ou use extratos já armazenados",
+    options=extratos_armazenados,
+    format_func=lambda extrato: f"{extrato['nome']} ({extrato['linhas']} registros)")
+atualizacao_incremental = st.sidebar.checkbox(
+    "Atualização incremental", value=True,
+    help="Processa apenas as notificações novas, alteradas ou removidas desde a última carga")
+diagnostico = st.sidebar.checkbox(
+    "Diagnóstico de desempenho", value=False,
+    help="Mostra o tempo, as linhas e o pico de memória de cada etapa do processamento")
 
+# Medições das etapas desta execução, também registradas no log de desempenho
+iniciar_log()
+medicoes = Medicoes({'regiao': regiao, 'origem': 'painel'})
 
-if uploaded_files:
-    # Processamento dos arquivos
-    with st.spinner('Processando arquivos...'):
-        dados_2020_2021_2022 = pd.DataFrame()
-        dados_geral = pd.DataFrame()
-        
-        # Extrair arquivos ZIP
-        for uploaded_file in uploaded_files:
-            with zipfile.ZipFile(BytesIO(uploaded_file.read()), 'r') as zip_ref:
-                zip_ref.extractall('temp_zip')
-        
-        # Processar arquivos DBF
-        for arquivo_dbf in sorted(os.listdir('temp_zip/')):
-            if arquivo_dbf.lower().endswith('.dbf'):
-                arquivo_dbf_path = 'temp_zip/' + arquivo_dbf
-                dbf = DBF(arquivo_dbf_path, encoding='latin-1', ignore_missing_memofile=True)
-                dados = pd.DataFrame(iter(dbf))
-                
-                # Filtros específicos
-                dados_filtrados = dados[(dados['CLASSI_FIN']=='5')&
-                                      (dados['ID_RG_RESI']=='014 CRS')&
-                                      (dados['UTI']=='1')&
-                                      (dados['DT_SAIDUTI']=='')]
-                
-                dados_filtrados = dados_filtrados.filter(['NM_PACIENT', 'ID_MN_RESI','DT_NOTIFIC'])
-                dados_filtrados.columns = ['nome do paciente', 'municipio de residencia', 'data da notificacao']
-                dados_2020_2021_2022 = pd.concat([dados_2020_2021_2022, dados_filtrados])
-                dados_geral = pd.concat([dados_geral, dados])
-        
-        # Limpar diretório temporário
-        for f in os.listdir('temp_zip/'):
-            os.remove(os.path.join('temp_zip/', f))
-        os.rmdir('temp_zip/')
-        
-        # Processar dados consolidados
-        dados_2020_2021_2022.reset_index(drop=True).sort_values(by='municipio de residencia').drop_duplicates(inplace=True)
-        
-        dados_consolidados = dados_geral[(dados_geral['CLASSI_FIN']=='5')&(dados_geral['ID_RG_RESI']=='014 CRS')]
-        consolidado = pd.DataFrame(dados_consolidados.groupby(by='ID_MN_RESI')['ID_RG_RESI'].count()).reset_index()
-        consolidado.columns = ['municipio de residencia', 'total']
-
-        
-        dados_consolidados3 = dados_geral[(dados_geral['ID_RG_RESI']=='014 CRS')]
-        dados_consolidados2 = dados_consolidados3.filter(['NM_PACIENT', 'ID_MN_RESI','ID_MUNICIP',"DT_NOTIFIC", 'DT_SIN_PRI', 'CRITERIO',
-                                                         'UTI', 'DT_SAIDUTI', 'CLASSI_FIN', 'EVOLUCAO', 'DT_EVOLUCAO' , 'PCR_RESUL' , 'TP_FLU_PCR' , 'PCR_FLUASU' , 'PCR_FLUBLI' , 'PCR_VSR', 'PCR_PARA1' , 'PCR_PARA2' ,
-                                                          'PCR_PARA3' , 'PCR_PARA4' , 'PCR_ADENO' , 'PCR_RINO'])
-
-        # Transformações de dados
-        dados_consolidados2['criterio_texto'] = dados_consolidados2['CRITERIO'].replace({'1':'laboratorial',
-                                                                                         '2':'clinico-epidemiologico',
-                                                                                         '3':'clinico',
-                                                                                         '4':'clinico-imagem'})
-
-        dados_consolidados2['UTI_texto'] = dados_consolidados2['UTI'].replace({'1':'Sim', '2':'Não', '9':'Ignorado'})
-
-        dados_consolidados2['Classificação final'] = dados_consolidados2['CLASSI_FIN'].replace({'1':'SRAG por influenza',
-                                                                                         '2':'SRAG por outro vírus respiratório',
-                                                                                         '3':'SRAG por outro agente etiológico',
-                                                                                         '4':'SRAG não especificado',
-                                                                                         '5':'SRAG por Covid-19',
-                                                                                         '':'Suspeito'})
-
-        dados_consolidados2['Evolução'] = dados_consolidados2['EVOLUCAO'].replace({'1':'Cura',
-                                                                                         '2':'Óbito',
-                                                                                         '3':'Óbito por outras causas',
-                                                                                         '9':'Ignorado',
-                                                                                         '':'Aguardando'})
-
-        dados_consolidados2['PCR_RESUL'] = dados_consolidados2['PCR_RESUL'].replace({'1':'Detectável',
-                                                                                          '2':'Não detectável',
-                                                                                          '3':'Inconclusivo',
-                                                                                          '4':'Não realizado',
-                                                                                          '5':'Aguardando resultado',
-                                                                                          '9':'Ignorado'})
-
-        dados_consolidados2['TP_FLU_PCR'] = dados_consolidados2['TP_FLU_PCR'].replace({'1':'Influenza A',
-                                                                                         '2':'Influenza B'})
-
-        dados_consolidados2['PCR_FLUASU'] = dados_consolidados2['PCR_FLUASU'].replace({'1':'Influenza A (H1N1)',
-                                                                                         '2':'Influenza A (H3N2)',
-                                                                                         '3': 'Influenza nao subtipado',
-                                                                                         '4': 'Influenza nao subtipavel',
-                                                                                         '5': 'Inconclusivo',
-                                                                                         '6': 'outro'})
-
-        dados_consolidados2['PCR_FLUBLI'] = dados_consolidados2['PCR_FLUBLI'].replace({'1':'Victoria',
-                                                                                         '2':'Yamagatha',
-                                                                                         '3': 'Nao realizado',
-                                                                                         '4': 'Inconclusivo',
-                                                                                         '5': 'outro'})
-
-        lista_virusresp = ['PCR_VSR', 'PCR_PARA1' , 'PCR_PARA2' , 'PCR_PARA3' , 'PCR_PARA4' , 'PCR_ADENO' , 'PCR_RINO']
-
-        for i in lista_virusresp:
-            dados_consolidados2[i] = dados_consolidados2[i].replace({'1': 'sim' , ' ' : ' '})
-
-        dados_consolidados2 = dados_consolidados2[['NM_PACIENT', 'ID_MN_RESI','ID_MUNICIP', 'DT_NOTIFIC', 'DT_SIN_PRI', 'UTI_texto',
-                                                   'DT_SAIDUTI', 'criterio_texto',  'Classificação final', 'Evolução' ,
-                                                   'PCR_RESUL' , 'TP_FLU_PCR' , 'PCR_FLUASU' , 'PCR_FLUBLI' , 'PCR_VSR' ,
-                                                   'PCR_PARA1' , 'PCR_PARA2' , 'PCR_PARA3' , 'PCR_PARA4' , 'PCR_ADENO' ,
-                                                   'PCR_RINO']]
-
-        dados_consolidados2.columns = ['nome', 'municipio de residencia','municipo de notificacao', 'data de notificacao', 'inicio dos sintomas',
-                                       'Foi para UTI?', 'Data de saída da UTI', 'Critério de confirmação',
-                                       'Classificação final', 'Evolução' , 'Resultado outro PCR' ,
-                                       'Tipo Influenza' ,'subtipo Influenza A' , 'subtipo Influenza B' , 'VSR' ,
-                                       'PARA1' , 'PARA2' , 'PARA3' , 'PARA4' , 'ADENO' , 'RINO']
-
-        dados_consolidados2['data de notificacao'] = pd.to_datetime(dados_consolidados2['data de notificacao'], dayfirst=True)
-        dados_consolidados2 = dados_consolidados2.sort_values(by='data de notificacao')
-        dados_consolidados2['data de notificacao'] = dados_consolidados2['data de notificacao'].astype('str')
-
-        # Consolidado por vírus por município
-        # Supondo que df seja seu DataFrame original
-        df = dados_consolidados2.copy()
-
-        # 1. Identificar colunas disponíveis
-        colunas_base = ['municipio de residencia', 'Classificação final', 'Tipo Influenza', 
-                        'subtipo Influenza A', 'subtipo Influenza B', 'VSR', 'ADENO', 'RINO']
-        
-        # Verificar colunas existentes
-        colunas_disponiveis = [col for col in colunas_base if col in df.columns]
-        print(f"Colunas disponíveis: {colunas_disponiveis}")
-        
-        # 2. Criar colunas para cada tipo de vírus
-        # COVID
-        df['COVID'] = df['Classificação final'].apply(lambda x: 1 if x == 'SRAG por Covid-19' else 0)
-        
-        # Influenza A e subtipos
-        df['INFLUENZA_A'] = df['Tipo Influenza'].apply(lambda x: 1 if x == 'Influenza A' else 0)
-        df['INFLUENZA_A_H1N1'] = df['subtipo Influenza A'].apply(lambda x: 1 if x == 'Influenza A (H1N1)' else 0)
-        df['INFLUENZA_A_H3N2'] = df['subtipo Influenza A'].apply(lambda x: 1 if x == 'Influenza A (H3N2)' else 0)
-        
-        # Influenza B e subtipos
-        df['INFLUENZA_B'] = df['Tipo Influenza'].apply(lambda x: 1 if x == 'Influenza B' else 0)
-        df['INFLUENZA_B_VICTORIA'] = df['subtipo Influenza B'].apply(lambda x: 1 if x == 'Victoria' else 0)
-        df['INFLUENZA_B_YAMAGATA'] = df['subtipo Influenza B'].apply(lambda x: 1 if x == 'Yamagatha' else 0)
-        
-        # Outros vírus respiratórios
-        virus_cols = ['VSR', 'ADENO', 'RINO']
-        for col in virus_cols:
-            if col in df.columns:
-                df[col] = df[col].apply(lambda x: 1 if str(x).strip().lower() in ['sim', '1'] else 0)
-        
-        # 3. Criar a tabela consolidada
-        cols_contagem = ['COVID', 'INFLUENZA_A', 'INFLUENZA_A_H1N1', 'INFLUENZA_A_H3N2',
-                        'INFLUENZA_B', 'INFLUENZA_B_VICTORIA', 'INFLUENZA_B_YAMAGATA'] + virus_cols
-        
-        tabela_virus = df.groupby('municipio de residencia')[cols_contagem].sum()
-        
-        # 4. Adicionar totais
-        #tabela_virus['TOTAL_INFLUENZA'] = tabela_virus['INFLUENZA_A'] + tabela_virus['INFLUENZA_B']
-        tabela_virus['TOTAL_VIRUS'] = tabela_virus[['COVID', 
-                        'INFLUENZA_A', 
-                        'INFLUENZA_B',
-                        ] + virus_cols].sum(axis=1)
-        
-        # 5. Reordenar colunas
-        ordem_colunas = ['COVID', 
-                        'INFLUENZA_A', 'INFLUENZA_A_H1N1', 'INFLUENZA_A_H3N2',
-                        'INFLUENZA_B', 'INFLUENZA_B_VICTORIA', 'INFLUENZA_B_YAMAGATA',
-                        ] + virus_cols + ['TOTAL_VIRUS']
-        
-        tabela_virus = tabela_virus[ordem_colunas]
-        
-        # 6. Resetar índice e formatar
-        tabela_virus = tabela_virus.reset_index()
-        tabela_virus = tabela_virus.rename(columns={'municipio de residencia': 'Município'})
-
-        # Lista completa de municípios
-        municipios_completos = [
-            'ALECRIM', 'ALEGRIA', 'BOA VISTA DO BURICA', 'CAMPINA DAS MISSOES',
-            'CANDIDO GODOI', 'DOUTOR MAURICIO CARDOSO', 'GIRUA', 'HORIZONTINA',
-            'INDEPENDENCIA', 'NOVA CANDELARIA', 'NOVO MACHADO', 'PORTO LUCENA',
-            'PORTO MAUA', 'PORTO VERA CRUZ', 'SANTA ROSA', 'SANTO CRISTO',
-            'SAO JOSE DO INHACORA', 'SAO PAULO DAS MISSOES', 'SENADOR SALGADO FILHO',
-            'TRES DE MAIO', 'TUCUNDUVA', 'TUPARENDI'
-        ]
-        
-        # Criar DataFrame base com todos os municípios
-        df_base = pd.DataFrame({'Município': municipios_completos})
 
-        # Fazer merge para incluir todos os municípios
-        tabela_completa = pd.merge(df_base, tabela_virus, on='Município', how='left')
-        
-        # Preencher NA com 0 para as colunas numéricas
-        colunas_numericas = tabela_completa.columns.difference(['Município'])
-        tabela_completa[colunas_numericas] = tabela_completa[colunas_numericas].fillna(0).astype(int)
-        
-        # Ordenar por município
-        tabela_completa = tabela_completa.sort_values('Município')
 
-        # Obitos
-        obitos = pd.pivot_table(dados_consolidados2[dados_consolidados2['Evolução']=='Óbito'], index=['municipio de residencia'], columns = ['Classificação final'], aggfunc='size').fillna(0)
+# Resultado pré-processado pela linha de comando, usado enquanto não há arquivos carregados
+manifesto = ler_manifesto(DIRETORIO_RESULTADOS, regiao)
 
-        
+if uploaded_files or extratos_selecionados:
+    # Processamento dos arquivos
+    with st.spinner('Processando arquivos...'):
+        resultado, resumo_atualizacao = processar_carga(uploaded_files, extratos_selecionados, regiao,
+                                                        atualizacao_incremental, medicoes)
+    st.success('Processamento concluído!')
+elif manifesto is not None:
+    with etapa(medicoes, 'leitura_resultado') as registro:
+        # Lido uma vez por data de geração e compartilhado entre as sessões
+        resultado = usar_compartilhado(('preprocessado', regiao, manifesto['gerado_em']),
+                                       lambda: carregar_resultado(DIRETORIO_RESULTADOS, regiao))
+        resumo_atualizacao = None
+        registro['linhas_saida'] = len(resultado.dados_consolidados2)
+    st.info(f"Dados pré-processados em {manifesto['gerado_em']} ({manifesto['registros']} notificações). "
+            "Carregue arquivos para atualizar a análise.")
+else:
+    liberar_compartilhado()
+    resultado = None
 
+if resultado is not None:
     # Visualização dos dados
-    st.success('Processamento concluído!')
+    dados_2020_2021_2022 = resultado.pacientes_uti
+    dados_consolidados2 = resultado.dados_consolidados2
+    with etapa(medicoes, 'tabelas', len(resultado.matriz)):
+        consolidado, tabela_virus, tabela_completa, obitos = resultado.tabelas
+    if resumo_atualizacao and (resumo_atualizacao['novos'] or resumo_atualizacao['alterados'] or resumo_atualizacao['removidos']):
+        st.sidebar.info(
+            f"Atualização incremental: {resumo_atualizacao['novos']} notificações novas, "
+            f"{resumo_atualizacao['alterados']} alteradas e {resumo_atualizacao['removidos']} removidas. "
+            f"Municípios afetados: {', '.join(resumo_atualizacao['municipios'])}")
     
     # Abas para diferentes visualizações
-    tab1, tab2, tab3, tab4 = st.tabs(["Pacientes em UTI", "Casos por Município", "Dados Detalhados", 'Mapa'])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Pacientes em UTI", "Casos por Município", "Dados Detalhados", 'Mapa',
+                                            'Curva Epidêmica'])
     
     with tab1:
         st.header("Pacientes com COVID-19 em UTI (sem data de saída)")
         st.dataframe(dados_2020_2021_2022)
         
         # Opção para download
-        csv = dados_2020_2021_2022.to_csv(index=False).encode('utf-8')
-        st.download_button(
-            "Baixar dados como CSV",
-            csv,
-            "pacientes_uti.csv",
-            "text/csv",
-            key='download-csv'
-        )
+        botao_download("Baixar dados", "pacientes_uti", dados_2020_2021_2022,
+                       ('pacientes_uti', resultado.versao), key='download-csv')
     
     with tab2:
         st.header("Total de casos por município")
@@ -302,50 +363,16 @@ if uploaded_files:
         #st.bar_chart(tabela_virus, stack=False)
     
     with tab4:
-        # Carregar o GeoJSON
-        with open('municipios_14.geojson', 'r', encoding='utf-8') as f:
-            geojson_data = json.load(f)
-        
-        # Criar um dicionário de mapeamento de nomes de municípios para padronização
-        mapeamento_nomes = {
-            'ALECRIM': 'Alecrim',
-            'ALEGRIA': 'Alegria',
-            'BOA VISTA DO BURICA': 'Boa Vista do Buricá',
-            'CAMPINA DAS MISSOES': 'Campina das Missões',
-            'CANDIDO GODOI': 'Cândido Godói',
-            'DOUTOR MAURICIO CARDOSO': 'Doutor Maurício Cardoso',
-            'GIRUA': 'Giruá',
-            'HORIZONTINA': 'Horizontina',
-            'INDEPENDENCIA': 'Independência',
-            'NOVA CANDELARIA': 'Nova Candelária',
-            'NOVO MACHADO': 'Novo Machado',
-            'PORTO LUCENA': 'Porto Lucena',
-            'PORTO MAUA': 'Porto Mauá',
-            'PORTO VERA CRUZ': 'Porto Vera Cruz',
-            'SANTA ROSA': 'Santa Rosa',
-            'SANTO CRISTO': 'Santo Cristo',
-            'SAO JOSE DO INHACORA': 'São José do Inhacorá',
-            'SAO PAULO DAS MISSOES': 'São Paulo das Missões',
-            'SENADOR SALGADO FILHO': 'Senador Salgado Filho',
-            'TRES DE MAIO': 'Três de Maio',
-            'TUCUNDUVA': 'Tucunduva',
-            'TUPARENDI': 'Tuparendi'
-        }
-        
-        # Padronizar nomes nos dados
-        tabela_completa['Município'] = tabela_completa['Município'].str.upper().map(mapeamento_nomes).fillna(tabela_completa['Município'])
-        
-        # 2. Criar dicionário de casos por município
-        selecao_virus = st.selectbox('Selecione o vírus', options = ['COVID', 'INFLUENZA_A', 'INFLUENZA_A_H1N1', 'INFLUENZA_A_H3N2', 'INFLUENZA_B', 'INFLUENZA_B_VICTORIA', 'INFLUENZA_B_YAMAGATA','TOTAL_VIRUS'])
-        totais_por_municipio = dict(zip(tabela_completa['Município'], tabela_completa[selecao_virus]))
+        # Geometria simplificada e camadas de valores já calculadas para cada indicador
+        with etapa(medicoes, 'camadas_mapa', len(tabela_completa)):
+            geometria = obter_geometria(regiao)
+            camadas = preparar_camadas_mapa(tabela_completa, INDICADORES_MAPA, regiao)
         
-        # 3. Adicionar os dados ao GeoJSON
-        for feature in geojson_data['features']:
-            nome_municipio = feature['properties']['NOME']
-            feature['properties']['casos'] = totais_por_municipio.get(nome_municipio, 0)
+        # 2. Escolher o indicador
+        selecao_virus = st.selectbox('Selecione o vírus', options = INDICADORES_MAPA)
         
         # 4. Configurar o mapa
-        m = folium.Map(location=[-27.8, -54.5], zoom_start=9)
+        m = folium.Map(location=centro(geometria), zoom_start=9)
         
         # 5. Configurar o tooltip
         tooltip = folium.GeoJsonTooltip(
@@ -375,36 +402,30 @@ if uploaded_files:
             style="background-color: white; font-weight: bold;",
         )
         
-        # 7. Adicionar a camada GeoJson ao mapa
-        folium.GeoJson(
-            geojson_data,
+        # 7. A geometria fica no mapa base, desenhado uma vez; ao trocar o indicador, só a camada
+        # com os casos e as cores de cada município é enviada e aplicada aos polígonos
+        municipios_mapa = folium.GeoJson(
+            geometria_mapa(geometria),
             name='Casos de SRAG',
-            style_function=lambda feature: {
-                'fillColor': '#ffeda0' if feature['properties']['casos'] == 0 else
-                            '#feb24c' if feature['properties']['casos'] <= 5 else
-                            '#fc4e2a' if feature['properties']['casos'] <= 20 else
-                            '#b10026',
-                'color': 'black',
-                'weight': 0.5,
-                'fillOpacity': 0.7
-            },
+            style_function=lambda feature: {'fillColor': feature['properties']['cor'], **ESTILO},
             tooltip=tooltip,
             popup=popup,
             highlight_function=lambda x: {'weight': 2, 'color': 'black'}
         ).add_to(m)
+        CamadaMunicipios().add_to(municipios_mapa)
+        camada_casos = folium.FeatureGroup(name='Indicador', control=False)
+        ValoresCamada(geometria, camadas[selecao_virus]).add_to(camada_casos)
 
         
-        # Adicionar controle de camadas
-        folium.LayerControl().add_to(m)
-        
         # Mostrar o mapa no Streamlit
-        st.header('Distribuição Geográfica de Casos de SRAG - CRS 14')
+        st.header(f'Distribuição Geográfica de Casos de SRAG - CRS {regional.crs}')
         st.markdown('Mapa de calor dos casos totais por município')
         
         # Ajustar o tamanho do mapa
         coluna_mapa, coluna_legenda = st.columns([2,1])
-        with coluna_mapa:
-            st_folium(m, width=725, height=500)
+        with coluna_mapa, etapa(medicoes, 'mapa', len(geometria['features'])):
+            st_folium(m, width=725, height=500, key='mapa', feature_group_to_add=camada_casos,
+                      layer_control=folium.LayerControl(), returned_objects=[])
         
         # Adicionar legenda explicativa
         with coluna_legenda:
@@ -421,52 +442,89 @@ if uploaded_files:
     
     with tab3:
         st.header("Dados detalhados de todos os casos")
-        st.dataframe(dados_consolidados2)
-        
         
-        # Filtros interativos
+        # Filtros interativos, resolvidos pelos índices da carga
         st.subheader("Filtrar dados")
+        with etapa(medicoes, 'indice_filtros', len(dados_consolidados2)):
+            indice = resultado.indice
         col1, col2 = st.columns(2)
         
         with col1:
             municipio = st.selectbox(
                 'Município',
-                options=['Todos'] + sorted(dados_consolidados2['municipio de residencia'].unique().tolist()))
+                options=['Todos'] + indice.valores('municipio de residencia'))
             
             classificacao = st.selectbox(
                 'Classificação Final',
-                options=['Todos'] + sorted(dados_consolidados2['Classificação final'].unique().tolist()))
+                options=['Todos'] + indice.valores('Classificação final'))
         
         with col2:
             evolucao = st.selectbox(
                 'Evolução',
-                options=['Todos'] + sorted(dados_consolidados2['Evolução'].unique().tolist()))
+                options=['Todos'] + indice.valores('Evolução'))
             
             uti = st.selectbox(
                 'UTI',
-                options=['Todos'] + sorted(dados_consolidados2['Foi para UTI?'].unique().tolist()))
+                options=['Todos'] + indice.valores('Foi para UTI?'))
         
         # Aplicar filtros
-        filtered_data = dados_consolidados2.copy()
-        if municipio != 'Todos':
-            filtered_data = filtered_data[filtered_data['municipio de residencia'] == municipio]
-        if classificacao != 'Todos':
-            filtered_data = filtered_data[filtered_data['Classificação final'] == classificacao]
-        if evolucao != 'Todos':
-            filtered_data = filtered_data[filtered_data['Evolução'] == evolucao]
-        if uti != 'Todos':
-            filtered_data = filtered_data[filtered_data['Foi para UTI?'] == uti]
+        selecao = {coluna: valor for coluna, valor in [('municipio de residencia', municipio),
+                                                       ('Classificação final', classificacao),
+                                                       ('Evolução', evolucao),
+                                                       ('Foi para UTI?', uti)] if valor != 'Todos'}
+        with etapa(medicoes, 'filtros', len(dados_consolidados2)) as registro:
+            posicoes = indice.filtrar(selecao)
+            registro['linhas_saida'] = len(posicoes)
+        
+        # Só a página visível é enviada ao navegador
+        col1, col2, col3 = st.columns([1, 1, 2])
+        with col1:
+            tamanho_pagina = st.selectbox('Linhas por página', options=TAMANHOS_PAGINA)
+        paginas = max(1, -(-len(posicoes) // tamanho_pagina))
+        with col2:
+            pagina = st.number_input('Página', min_value=1, max_value=paginas, value=1, step=1)
+        with col3:
+            st.markdown(f"**{len(posicoes)}** registros, página {pagina} de {paginas}")
         
-        st.dataframe(filtered_data)
+        st.dataframe(dados_consolidados2.iloc[paginar(posicoes, pagina, tamanho_pagina)], column_config=FORMATO_DATAS)
         
-        # Opção para download
-        csv = filtered_data.to_csv(index=False).encode('utf-8')
-        st.download_button(
-            "Baixar dados filtrados como CSV",
-            csv,
-            "dados_filtrados.csv",
-            "text/csv",
-            key='download-filtered-csv'
-        )
+        # Opção para download, sem copiar as linhas filtradas
+        botao_download("Baixar dados filtrados", "dados_filtrados", dados_consolidados2,
+                       ('dados_filtrados', resultado.versao, sorted(selecao.items())),
+                       key='download-filtered-csv', posicoes=posicoes)
+
+    with tab5:
+        st.header("Curva epidêmica por semana epidemiológica")
+        st.markdown("Semana epidemiológica do início dos sintomas (ou da notificação, quando o início não foi informado)")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            medida_curva = st.selectbox('Medida', options=list(MEDIDAS_CURVA), format_func=MEDIDAS_CURVA.get)
+            municipios_curva = st.multiselect(
+                'Municípios (todos, se nenhum for escolhido)',
+                options=sorted(resultado.cubo.index.get_level_values('municipio').unique()))
+        with col2:
+            classificacoes_curva = st.multiselect(
+                'Classificação final (todas, se nenhuma for escolhida)',
+                options=sorted(resultado.cubo.index.get_level_values('classificacao').unique()))
+        
+        # Fatia do cubo pré-agregado: não percorre as notificações
+        with etapa(medicoes, 'curva_epidemica', len(resultado.cubo)) as registro:
+            curva = fatiar_cubo(resultado.cubo, medida_curva, municipios_curva, classificacoes_curva)
+            registro['linhas_saida'] = len(curva)
+        if curva.empty:
+            st.info("Não há casos para os filtros escolhidos.")
+        else:
+            st.line_chart(curva)
+            st.dataframe(curva.assign(Total=curva.sum(axis=1)), use_container_width=True)
+
+    if diagnostico:
+        st.sidebar.subheader("Diagnóstico")
+        st.sidebar.dataframe(medicoes.tabela(), hide_index=True)
+        st.sidebar.caption(f"Tempo total: {medicoes.tempo_total():.2f} s (execução {medicoes.execucao})")
+        compartilhados = obter_repositorio().estatisticas()
+        st.sidebar.caption(f"Dados compartilhados: {compartilhados['conjuntos']} conjuntos, "
+                           f"{compartilhados['bytes'] / 1024 ** 2:.0f} MB, "
+                           f"{compartilhados['referencias']} sessões em uso")
 else:
     st.warning("Por favor, carregue os arquivos ZIP para começar a análise.")
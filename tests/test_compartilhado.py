@@ -0,0 +1,113 @@
+"""Repositório de conjuntos compartilhados (compartilhado.py) com várias sessões ao mesmo tempo."""
+import gc
+import threading
+import time
+
+import pytest
+
+from compartilhado import RepositorioCompartilhado
+
+
+def em_paralelo(funcao, sessoes):
+    """Resultados de `funcao()` chamada ao mesmo tempo por `sessoes` threads; repassa o primeiro erro."""
+    barreira = threading.Barrier(sessoes)
+    resultados, erros = [], []
+
+    def sessao():
+        barreira.wait()
+        try:
+            resultados.append(funcao())
+        except Exception as erro:
+            erros.append(erro)
+
+    threads = [threading.Thread(target=sessao) for _ in range(sessoes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    assert not any(thread.is_alive() for thread in threads)
+    if erros:
+        raise erros[0]
+    return resultados
+
+
+def test_calculo_unico_com_tamanho_lento():
+    repositorio = RepositorioCompartilhado()
+    calculos = []
+
+    def calcular():
+        calculos.append(1)
+        return object()
+
+    def tamanho(valor):
+        time.sleep(0.05)
+        return 10
+
+    # Sessões que chegam enquanto o tamanho é estimado esperam pelo mesmo cálculo
+    referencias = em_paralelo(lambda: repositorio.adquirir('a', calcular, tamanho), 8)
+    atrasadas = em_paralelo(lambda: repositorio.adquirir('a', calcular, tamanho), 4)
+
+    assert len(calculos) == 1
+    assert len({id(referencia.valor) for referencia in referencias + atrasadas}) == 1
+    assert repositorio.estatisticas() == {'conjuntos': 1, 'bytes': 10, 'referencias': 12}
+
+
+def test_descarte_concorrente():
+    # Sem uso, toda entrada passa do tempo inativo e pode ser descartada entre dois pedidos
+    repositorio = RepositorioCompartilhado(limite_memoria=0, tempo_inativo=0)
+
+    def usar():
+        for _ in range(200):
+            referencia = repositorio.adquirir('a', object, tamanho=lambda valor: 1)
+            assert referencia.valor is not None
+            repositorio.estatisticas()
+            referencia.liberar()
+
+    em_paralelo(usar, 6)
+    assert repositorio.estatisticas() == {'conjuntos': 0, 'bytes': 0, 'referencias': 0}
+
+
+def test_liberar_explicito_e_pela_coleta():
+    repositorio = RepositorioCompartilhado(tempo_inativo=0)
+    primeira = repositorio.adquirir('a', object)
+    segunda = repositorio.adquirir('a', object)
+    assert repositorio.estatisticas()['referencias'] == 2
+
+    primeira.liberar()
+    primeira.liberar()
+    assert not primeira.ativa
+    assert repositorio.estatisticas() == {'conjuntos': 1, 'bytes': 0, 'referencias': 1}
+
+    del segunda
+    gc.collect()
+    assert repositorio.estatisticas() == {'conjuntos': 0, 'bytes': 0, 'referencias': 0}
+
+
+def test_liberar_com_a_trava_adquirida():
+    # Como quando o coletor de lixo roda o finalizador dentro de uma seção crítica
+    repositorio = RepositorioCompartilhado(tempo_inativo=0)
+    referencia = repositorio.adquirir('a', object)
+
+    def liberar_dentro_da_trava():
+        with repositorio._trava:
+            referencia.liberar()
+
+    thread = threading.Thread(target=liberar_dentro_da_trava, daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert repositorio.estatisticas() == {'conjuntos': 0, 'bytes': 0, 'referencias': 0}
+
+
+def test_falha_no_calculo():
+    repositorio = RepositorioCompartilhado()
+
+    def falhar():
+        time.sleep(0.05)
+        raise RuntimeError('falhou')
+
+    with pytest.raises(RuntimeError):
+        em_paralelo(lambda: repositorio.adquirir('a', falhar), 4)
+    # Depois da falha, a chave volta a ser calculada
+    assert repositorio.adquirir('a', lambda: 'valor').valor == 'valor'
+    assert repositorio._calculando == {}
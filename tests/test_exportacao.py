@@ -0,0 +1,69 @@
+"""Exportação em blocos (exportacao.py) comparada com a exportação direta do pandas."""
+import gzip
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from exportacao import FORMATOS, CacheExportacoes, chave_exportacao, exportar
+
+
+@pytest.fixture
+def dados():
+    gerador = np.random.default_rng(5)
+    return pd.DataFrame({
+        'municipio de residencia': pd.Categorical(gerador.choice(['SANTA ROSA', 'TRÊS DE MAIO', 'GIRUÁ'], 1000)),
+        'data da notificacao': pd.date_range('2023-01-01', periods=1000, freq='h'),
+        'idade': gerador.integers(0, 100, 1000),
+        'observacao': np.where(gerador.random(1000) < 0.1, None, 'texto, com "aspas"\nem duas linhas'),
+    })
+
+
+def exportado(dados, formato, posicoes=None, **kwargs):
+    destino = io.BytesIO()
+    exportar(dados, destino, formato, posicoes, **kwargs)
+    return destino.getvalue()
+
+
+@pytest.mark.parametrize('posicoes', [None, np.array([3, 1, 500, 999]), np.arange(0, 1000, 7), np.array([], dtype=int)])
+def test_csv_como_pandas(dados, posicoes):
+    esperado = (dados if posicoes is None else dados.iloc[posicoes]).to_csv(index=False).encode('utf-8')
+    # Blocos pequenos, para cruzar as fronteiras entre blocos
+    assert exportado(dados, 'CSV', posicoes, linhas_por_bloco=64) == esperado
+    assert gzip.decompress(exportado(dados, 'CSV compactado (gzip)', posicoes, linhas_por_bloco=64)) == esperado
+
+
+@pytest.mark.parametrize('posicoes', [None, np.arange(0, 1000, 7), np.array([], dtype=int)])
+def test_parquet_como_pandas(dados, posicoes):
+    esperado = (dados if posicoes is None else dados.iloc[posicoes]).reset_index(drop=True)
+    lido = pd.read_parquet(io.BytesIO(exportado(dados, 'Parquet', posicoes, linhas_por_bloco=64)))
+    pd.testing.assert_frame_equal(lido, esperado, check_categorical=False)
+
+
+def test_formato_desconhecido(dados):
+    with pytest.raises(ValueError):
+        exportado(dados, 'XLSX')
+
+
+def test_cache_reaproveita(dados, tmp_path, monkeypatch):
+    cache = CacheExportacoes(str(tmp_path))
+    posicoes = np.arange(0, 1000, 3)
+    chaves = {formato: chave_exportacao('versao', 'filtros', formato) for formato in FORMATOS}
+    primeiros = {formato: cache.obter(chaves[formato], formato, dados, posicoes) for formato in FORMATOS}
+    for formato, conteudo in primeiros.items():
+        assert conteudo == exportado(dados, formato, posicoes)
+
+    # Com os arquivos em disco, um novo pedido não exporta de novo
+    monkeypatch.setattr('exportacao.exportar', None)
+    assert {formato: cache.obter(chaves[formato], formato, dados, posicoes) for formato in FORMATOS} == primeiros
+    assert len(set(chaves.values())) == len(FORMATOS)
+
+
+def test_cache_acima_do_limite(dados, tmp_path):
+    # Acima do limite, só o arquivo mais recente fica em disco, mas cada pedido recebe o seu conteúdo
+    cache = CacheExportacoes(str(tmp_path), limite_disco=1)
+    for passo in [1, 2, 3]:
+        posicoes = np.arange(0, 1000, passo)
+        assert cache.obter(chave_exportacao(passo), 'CSV', dados, posicoes) == exportado(dados, 'CSV', posicoes)
+    assert [arquivo.name for arquivo in tmp_path.iterdir()] == [chave_exportacao(3) + '.csv']
@@ -0,0 +1,72 @@
+"""Índice de filtros (filtros.py) comparado com a filtragem direta no pandas."""
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.sintetico import REGIAO_PAINEL, gerar_arquivo
+from filtros import COLUNAS_FILTRO, IndiceCategorias, paginar
+from ingestao import ler_dbf
+from pipeline import processar
+from regioes import ler_regionais
+
+
+@pytest.fixture(scope='module')
+def detalhados(tmp_path_factory):
+    """Tabela detalhada de uma carga processada, como a que o painel filtra."""
+    caminho = gerar_arquivo(str(tmp_path_factory.mktemp('filtros') / 'a.dbf'), 3000, fracao_regiao=0.5, semente=4)
+    resultado, _ = processar({'a.dbf': ler_dbf(caminho)}, REGIAO_PAINEL,
+                             municipios=ler_regionais()[REGIAO_PAINEL].municipios)
+    return resultado.dados_consolidados2
+
+
+def filtrar_pandas(dados, selecao):
+    mascara = np.ones(len(dados), dtype=bool)
+    for coluna, valor in selecao.items():
+        mascara &= (dados[coluna] == valor).to_numpy()
+    return np.flatnonzero(mascara)
+
+
+def test_valores_como_pandas(detalhados):
+    indice = IndiceCategorias(detalhados)
+    for coluna in COLUNAS_FILTRO:
+        assert indice.valores(coluna) == sorted(detalhados[coluna].dropna().unique())
+
+
+def test_filtrar_como_pandas(detalhados):
+    indice = IndiceCategorias(detalhados)
+    np.testing.assert_array_equal(indice.filtrar({}), np.arange(len(detalhados)))
+
+    # Cada coluna sozinha, com todos os valores, e pares de colunas com os dois valores mais comuns
+    for coluna in COLUNAS_FILTRO:
+        for valor in indice.valores(coluna):
+            np.testing.assert_array_equal(indice.filtrar({coluna: valor}), filtrar_pandas(detalhados, {coluna: valor}))
+    comuns = {coluna: detalhados[coluna].value_counts().index[:2] for coluna in COLUNAS_FILTRO}
+    for primeira, segunda in itertools.combinations(COLUNAS_FILTRO, 2):
+        for valores in itertools.product(comuns[primeira], comuns[segunda]):
+            selecao = dict(zip([primeira, segunda], valores))
+            np.testing.assert_array_equal(indice.filtrar(selecao), filtrar_pandas(detalhados, selecao))
+
+    selecao = {coluna: comuns[coluna][0] for coluna in COLUNAS_FILTRO}
+    np.testing.assert_array_equal(indice.filtrar(selecao), filtrar_pandas(detalhados, selecao))
+    assert len(indice.filtrar({COLUNAS_FILTRO[0]: 'MUNICIPIO INEXISTENTE'})) == 0
+
+
+def test_valores_ausentes():
+    # Valores nulos e categorias sem nenhuma linha não aparecem no índice
+    dados = pd.DataFrame({'municipio de residencia': pd.Categorical(['A', None, 'B', 'A'], categories=['A', 'B', 'C']),
+                          'Evolução': ['Cura', 'Óbito', None, 'Cura']})
+    indice = IndiceCategorias(dados, ['municipio de residencia', 'Evolução'])
+    assert indice.valores('municipio de residencia') == ['A', 'B']
+    assert indice.valores('Evolução') == ['Cura', 'Óbito']
+    for selecao in [{'municipio de residencia': 'A'}, {'Evolução': 'Óbito'},
+                    {'municipio de residencia': 'A', 'Evolução': 'Cura'}, {'municipio de residencia': 'C'}]:
+        np.testing.assert_array_equal(indice.filtrar(selecao), filtrar_pandas(dados, selecao))
+
+
+def test_paginar():
+    posicoes = np.arange(10, 35)
+    assert paginar(posicoes, 1, 10).tolist() == list(range(10, 20))
+    assert paginar(posicoes, 3, 10).tolist() == list(range(30, 35))
+    assert len(paginar(posicoes, 4, 10)) == 0
@@ -0,0 +1,73 @@
+"""Atualização incremental (incremental.py) comparada com o processamento completo da mesma carga."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.sintetico import REGIAO_PAINEL, gerar_arquivo
+from ingestao import ler_dbf
+from pipeline import processar
+from regioes import ler_regionais
+
+
+@pytest.fixture(scope='module')
+def cargas(tmp_path_factory):
+    """(carga anterior, carga nova): a nova tem notificações removidas, alteradas e novas."""
+    diretorio = tmp_path_factory.mktemp('cargas')
+    anterior = ler_dbf(gerar_arquivo(str(diretorio / 'a.dbf'), 4000, fracao_regiao=0.5, semente=1))
+    extras = ler_dbf(gerar_arquivo(str(diretorio / 'b.dbf'), 600, fracao_regiao=0.5, semente=2))
+
+    gerador = np.random.default_rng(3)
+    nova = anterior.drop(index=gerador.choice(len(anterior), 150, replace=False))
+    alteradas = gerador.choice(nova.index, 200, replace=False)
+    nova.loc[alteradas, 'CLASSI_FIN'] = '5'
+    nova.loc[alteradas[:50], 'UTI'] = '1'
+    nova.loc[alteradas[50:80], 'ID_MN_RESI'] = 'SANTA ROSA'
+    extras['NU_NOTIFIC'] = extras['NU_NOTIFIC'] + 'X'
+    return anterior, pd.concat([nova, extras], ignore_index=True)
+
+
+def _comparar(incremental, completo):
+    pd.testing.assert_frame_equal(incremental.matriz, completo.matriz)
+    pd.testing.assert_frame_equal(incremental.cubo, completo.cubo)
+    pd.testing.assert_frame_equal(incremental.pacientes_uti, completo.pacientes_uti)
+    # As categorias da tabela detalhada podem guardar valores que já saíram da carga
+    pd.testing.assert_frame_equal(incremental.dados_consolidados2, completo.dados_consolidados2,
+                                  check_categorical=False)
+    for tabela_incremental, tabela_completa in zip(incremental.tabelas, completo.tabelas):
+        pd.testing.assert_frame_equal(tabela_incremental, tabela_completa)
+
+
+@pytest.mark.filterwarnings('error::FutureWarning')
+@pytest.mark.parametrize('mudancas', ['todas', 'so_novas', 'so_removidas'])
+def test_incremental_igual_ao_completo(cargas, mudancas):
+    anterior, nova = cargas
+    # Só com notificações novas, nada sai da carga anterior; só com remoções, nada entra
+    if mudancas == 'so_novas':
+        nova = pd.concat([anterior, nova.iloc[len(nova) - 600:]], ignore_index=True)
+    elif mudancas == 'so_removidas':
+        nova = anterior.iloc[100:]
+    municipios = ler_regionais()[REGIAO_PAINEL].municipios
+
+    primeiro, _ = processar({'a.dbf': anterior}, REGIAO_PAINEL, municipios=municipios)
+    incremental, resumo = processar({'a.dbf': nova}, REGIAO_PAINEL, primeiro, municipios=municipios)
+    completo, _ = processar({'a.dbf': nova}, REGIAO_PAINEL, municipios=municipios)
+
+    assert (resumo['novos'] > 0) == (mudancas != 'so_removidas')
+    assert (resumo['alterados'] > 0) == (mudancas == 'todas')
+    assert (resumo['removidos'] > 0) == (mudancas != 'so_novas')
+    assert incremental.carga is not completo.carga
+    _comparar(incremental, completo)
+    assert incremental.versao == completo.versao
+
+
+def test_sem_numero_da_notificacao(cargas):
+    anterior, nova = cargas
+    municipios = ler_regionais()[REGIAO_PAINEL].municipios
+    primeiro, _ = processar({'a.dbf': anterior}, REGIAO_PAINEL, municipios=municipios)
+
+    # Sem NU_NOTIFIC no extrato, as notificações não podem ser pareadas: o processamento é completo
+    sem_numero = nova.drop(columns='NU_NOTIFIC')
+    atualizado, resumo = processar({'a.dbf': sem_numero}, REGIAO_PAINEL, primeiro, municipios=municipios)
+    completo, _ = processar({'a.dbf': sem_numero}, REGIAO_PAINEL, municipios=municipios)
+    assert resumo is None
+    _comparar(atualizado, completo)
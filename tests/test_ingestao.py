@@ -0,0 +1,156 @@
+"""Leitura em lotes (ingestao.py) comparada com a leitura completa do dbfread."""
+import struct
+import zipfile
+
+import pandas as pd
+import pytest
+from dbfread import DBF
+
+from benchmarks.sintetico import REGIAO_PAINEL, gerar_arquivo
+from armazem import ArmazemColunar
+from ingestao import (COLUNAS_SIVEP, _assinatura_arquivo, _hash_membro, iterar_lotes, ler_dbf, ler_dbf_regioes,
+                      ler_dbfs_regioes, ler_zips_regioes)
+
+
+def ler_dbfread(caminho, regiao=None, colunas=None):
+    """O DBF lido pelo dbfread, com os registros da `regiao` (ou todos) e as `colunas` (ou todas)."""
+    tabela = DBF(caminho, encoding='latin-1', ignore_missing_memofile=True)
+    registros = [registro for registro in tabela if regiao is None or registro['ID_RG_RESI'] == regiao]
+    return pd.DataFrame(registros, columns=[coluna for coluna in colunas or tabela.field_names
+                                            if coluna in tabela.field_names])
+
+
+def escrever_dbf(caminho, campos, registros):
+    """Escreve um DBF com `campos` [(nome, tipo, largura, decimais)] e `registros` [(marca, valores)]."""
+    tamanho_registro = 1 + sum(largura for _, _, largura, _ in campos)
+    partes = [struct.pack('<BBBBLHH20x', 3, 123, 1, 1, len(registros), 32 + 32 * len(campos) + 1, tamanho_registro)]
+    for nome, tipo, largura, decimais in campos:
+        partes.append(struct.pack('<11scLBB14x', nome.encode('ascii'), tipo.encode('ascii'), 0, largura, decimais))
+    partes.append(b'\r')
+    for marca, valores in registros:
+        partes.append(marca)
+        for (_, tipo, largura, _), valor in zip(campos, valores):
+            valor = valor.encode('latin-1')
+            partes.append(valor.rjust(largura) if tipo in 'NF' else valor.ljust(largura))
+    partes.append(b'\x1a')
+    with open(caminho, 'wb') as f:
+        f.write(b''.join(partes))
+
+
+CAMPOS_TIPADOS = [('ID_RG_RESI', 'C', 10, 0), ('NM_PACIENT', 'C', 30, 0), ('NU_IDADE_N', 'N', 3, 0),
+                  ('PESO', 'N', 6, 2), ('DT_NASC', 'D', 8, 0), ('VACINA', 'L', 1, 0)]
+
+REGISTROS_TIPADOS = [
+    (b' ', ['014 CRS', 'JOSÉ DA CONCEIÇÃO', '42', '71.50', '19810203', 'T']),
+    (b'*', ['014 CRS', 'EXCLUÍDO', '1', '1.00', '20000101', 'F']),
+    (b' ', ['003 CRS', 'MÁRCIA MÜLLER', '', '', '', '?']),
+    (b' ', ['014 CRS', 'INÊS', '7', '22.25', '20160630', 'N']),
+]
+
+
+def test_campos_tipados_como_dbfread(tmp_path):
+    caminho = str(tmp_path / 'tipados.dbf')
+    escrever_dbf(caminho, CAMPOS_TIPADOS, REGISTROS_TIPADOS)
+    colunas = [nome for nome, _, _, _ in CAMPOS_TIPADOS]
+
+    esperado = ler_dbfread(caminho)
+    assert esperado['NM_PACIENT'].tolist() == ['JOSÉ DA CONCEIÇÃO', 'MÁRCIA MÜLLER', 'INÊS']
+    pd.testing.assert_frame_equal(ler_dbf(caminho, None, colunas), esperado)
+    pd.testing.assert_frame_equal(ler_dbf(caminho, '014 CRS', colunas), ler_dbfread(caminho, '014 CRS'))
+
+
+def test_tipo_nao_suportado(tmp_path):
+    caminho = str(tmp_path / 'desconhecido.dbf')
+    escrever_dbf(caminho, [('ID_RG_RESI', 'C', 10, 0), ('CAMPO', 'X', 4, 0)], [(b' ', ['014 CRS', 'abcd'])])
+    with pytest.raises(ValueError, match='CAMPO'):
+        ler_dbf(caminho, None, ['ID_RG_RESI', 'CAMPO'])
+    # Sem o campo entre as colunas pedidas, o arquivo é lido normalmente
+    assert ler_dbf(caminho, None, ['ID_RG_RESI'])['ID_RG_RESI'].tolist() == ['014 CRS']
+
+
+@pytest.fixture(scope='module')
+def sintetico(tmp_path_factory):
+    return gerar_arquivo(str(tmp_path_factory.mktemp('sivep') / 'sivep.dbf'), 5000, fracao_regiao=0.3, semente=1)
+
+
+def test_sintetico_como_dbfread(sintetico):
+    esperado = ler_dbfread(sintetico, colunas=COLUNAS_SIVEP)
+    assert len(list(DBF(sintetico, encoding='latin-1').deleted)) > 0
+    assert esperado['NM_PACIENT'].str.contains('Ã|É|Ç|Ü').any()
+
+    pd.testing.assert_frame_equal(ler_dbf(sintetico, REGIAO_PAINEL),
+                                  ler_dbfread(sintetico, REGIAO_PAINEL, COLUNAS_SIVEP))
+
+    # Lotes pequenos, para cruzar as fronteiras entre lotes
+    with open(sintetico, 'rb') as f:
+        lotes = list(iterar_lotes(f, None, COLUNAS_SIVEP, registros_por_lote=700))
+    lido = pd.DataFrame({coluna: [valor for lote in lotes for valor in lote[coluna]] for coluna in lotes[0]})
+    pd.testing.assert_frame_equal(lido, esperado)
+
+
+def test_regioes_como_dbfread(sintetico):
+    regioes = ['014 CRS', '003 CRS', '999 CRS']
+    for regiao, dados in ler_dbf_regioes(sintetico, regioes).items():
+        pd.testing.assert_frame_equal(dados, ler_dbfread(sintetico, regiao, COLUNAS_SIVEP), check_index_type=False)
+
+
+def test_zips_com_armazem(sintetico, tmp_path):
+    caminho_zip = str(tmp_path / 'sivep.zip')
+    with zipfile.ZipFile(caminho_zip, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.write(sintetico, 'sivep.dbf')
+    with open(caminho_zip, 'rb') as f:
+        conteudos = [f.read()]
+    regioes = ['014 CRS', '003 CRS']
+    armazem = ArmazemColunar(str(tmp_path / 'armazem'))
+
+    sem_armazem = ler_zips_regioes(conteudos, regioes)
+    # A primeira leitura decodifica e grava; a segunda lê do armazém
+    for _ in range(2):
+        lido = ler_zips_regioes(conteudos, regioes, armazem=armazem)
+        for regiao in regioes:
+            pd.testing.assert_frame_equal(lido[0][regiao]['sivep.dbf'], sem_armazem[0][regiao]['sivep.dbf'])
+
+    # O hash calculado durante a leitura é o mesmo do conteúdo do DBF
+    with zipfile.ZipFile(caminho_zip) as zip_ref:
+        hash_dbf = _hash_membro(zip_ref, 'sivep.dbf')
+    assert {extrato['hash'] for extrato in armazem.extratos()} == {hash_dbf}
+    assert all(armazem.contem(hash_dbf, regiao, COLUNAS_SIVEP) for regiao in regioes)
+
+
+def test_zip_com_pastas(sintetico, tmp_path):
+    caminho_zip = str(tmp_path / 'pastas.zip')
+    outro = gerar_arquivo(str(tmp_path / 'outro.dbf'), 800, fracao_regiao=0.5, semente=2)
+    with zipfile.ZipFile(caminho_zip, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.write(sintetico, '2022/INFLUD.dbf')
+        zip_ref.write(outro, '2023/INFLUD.dbf')
+    with open(caminho_zip, 'rb') as f:
+        conteudos = [f.read()]
+    armazem = ArmazemColunar(str(tmp_path / 'armazem'))
+
+    # DBFs de mesmo nome em pastas diferentes são lidos (e armazenados) separadamente
+    for lido in [ler_zips_regioes(conteudos, [REGIAO_PAINEL])] + [
+            ler_zips_regioes(conteudos, [REGIAO_PAINEL], armazem=armazem) for _ in range(2)]:
+        arquivos = lido[0][REGIAO_PAINEL]
+        assert sorted(arquivos) == ['2022/INFLUD.dbf', '2023/INFLUD.dbf']
+        pd.testing.assert_frame_equal(arquivos['2022/INFLUD.dbf'], ler_dbf(sintetico, REGIAO_PAINEL))
+        pd.testing.assert_frame_equal(arquivos['2023/INFLUD.dbf'], ler_dbf(outro, REGIAO_PAINEL))
+    assert sorted(extrato['nome'] for extrato in armazem.extratos()) == ['2022/INFLUD.dbf', '2023/INFLUD.dbf']
+
+
+def test_dbfs_soltos_com_armazem(sintetico, tmp_path, monkeypatch):
+    regioes = ['014 CRS', '003 CRS']
+    armazem = ArmazemColunar(str(tmp_path / 'armazem'))
+    sem_armazem = ler_dbfs_regioes([sintetico], regioes)
+    for regiao in regioes:
+        pd.testing.assert_frame_equal(sem_armazem[0][regiao], ler_dbf_regioes(sintetico, regioes)[regiao])
+
+    # A primeira leitura decodifica e grava; a segunda lê do armazém, sem decodificar
+    lidos = [ler_dbfs_regioes([sintetico], regioes, armazem=armazem)]
+    monkeypatch.setattr('ingestao.ler_dbf_regioes', None)
+    lidos.append(ler_dbfs_regioes([sintetico], regioes, armazem=armazem))
+    for lido in lidos:
+        for regiao in regioes:
+            pd.testing.assert_frame_equal(lido[0][regiao], sem_armazem[0][regiao])
+    hash_dbf, crc, tamanho = _assinatura_arquivo(sintetico)
+    assert [(extrato['nome'], extrato['hash']) for extrato in armazem.extratos()] == [('sivep.dbf', hash_dbf)] * 2
+    assert armazem.assinaturas() == {(crc, tamanho)}